@@ -9,6 +9,8 @@ import json
 import glob
 from datetime import datetime
 
+from invoice_queue_writer import locked_queue, write_queue_file
+
 def add_henry_to_queue():
     """Add new Henry Schein JSON files to the invoice queue"""
     
@@ -51,10 +53,11 @@ def add_henry_to_queue():
         print(f"Added: {filename}")
     
     # Save updated queue
-    with open(queue_file, 'w') as f:
-        json.dump(queue, f, indent=2)
+    write_queue_file(queue_file, queue)
     
     print(f"Queue updated with {len(queue)} total entries ({added_count} new)")
 
 if __name__ == "__main__":
-    add_henry_to_queue() 
\ No newline at end of file
+    # Hold the queue lock for the whole read-add-write pass
+    with locked_queue("invoice_queue.json"):
+        add_henry_to_queue() 
\ No newline at end of file
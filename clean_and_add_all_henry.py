@@ -9,6 +9,8 @@ import json
 import glob
 from datetime import datetime
 
+from invoice_queue_writer import locked_queue, write_queue_file
+
 def load_json_file(filepath):
     """Load and parse a JSON file"""
     try:
@@ -108,8 +110,7 @@ def clean_and_add_all_henry():
             print(f"✅ Added: {invoice_data.get('vendor', 'Unknown')} - {invoice_data.get('invoice_number', 'No Number')}")
     
     # Save updated queue
-    with open(queue_file, 'w') as f:
-        json.dump(cleaned_queue, f, indent=2)
+    write_queue_file(queue_file, cleaned_queue)
     
     print("=" * 50)
     print(f"📊 CLEAN AND ADD COMPLETE")
@@ -134,7 +135,9 @@ def main():
     print("🎯 PCS AI - Clean and Add All Henry")
     print("=" * 50)
     
-    clean_and_add_all_henry()
+    # Hold the queue lock for the whole read-clean-write pass
+    with locked_queue("invoice_queue.json"):
+        clean_and_add_all_henry()
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
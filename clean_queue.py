@@ -8,6 +8,8 @@ import os
 import json
 from datetime import datetime
 
+from invoice_queue_writer import locked_queue, write_queue_file
+
 def clean_queue():
     """Clean the invoice queue to only keep properly formatted Henry Schein invoices"""
     
@@ -41,8 +43,7 @@ def clean_queue():
             print(f"🗑️ Removed: {entry.get('invoice_number', 'Unknown')} - {entry.get('vendor', 'Unknown')}")
     
     # Save cleaned queue
-    with open(queue_file, 'w') as f:
-        json.dump(cleaned_queue, f, indent=2)
+    write_queue_file(queue_file, cleaned_queue)
     
     print("=" * 50)
     print(f"📊 CLEANING COMPLETE")
@@ -61,7 +62,9 @@ def main():
     print("🎯 PCS AI - Clean Queue")
     print("=" * 50)
     
-    clean_queue()
+    # Hold the queue lock for the whole read-clean-write pass
+    with locked_queue("invoice_queue.json"):
+        clean_queue()
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -5,17 +5,12 @@ Reads smiles_office_info.xls and converts it to JSON for frontend use.
 """
 import pandas as pd
 import json
-import os
 
 def convert_office_info():
     """Convert smiles_office_info.xls to JSON format"""
     xls_file = "smiles_office_info.xls"
     json_file = "public/office_info.json"
     
-    if not os.path.exists(xls_file):
-        print(f"❌ {xls_file} not found")
-        return False
-    
     try:
         # Read the Excel file
         print(f"📖 Reading {xls_file}...")
@@ -84,6 +79,12 @@ def convert_office_info():
         print(f"\n✅ Successfully converted {len(offices)} offices to {json_file}")
         return True
         
+    except FileNotFoundError as e:
+        if e.filename != xls_file:
+            print(f"❌ Error converting office info: {e}")
+        else:
+            print(f"❌ {xls_file} not found")
+        return False
     except Exception as e:
         print(f"❌ Error converting office info: {e}")
         return False
@@ -3,17 +3,19 @@ import email
 from email.header import decode_header
 import os
 import time
-import subprocess
 import re
+import logging
+import traceback
 from datetime import datetime
 
+import vendor_router
+
 EMAIL_USER = "invoices@pcsmilesai.com"
 EMAIL_PASS = "Inv!PCSAI"
 IMAP_SERVER = "imap.secureserver.net"
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 SAVE_DIR = os.path.join(BASE_DIR, "email_invoices")  # Changed to email_invoices
-VENDOR_ROUTER_PATH = os.path.join(BASE_DIR, "vendor_router.py")
 LOG_PATH = os.path.join(BASE_DIR, "log.txt")
 
 os.makedirs(SAVE_DIR, exist_ok=True)
@@ -24,33 +26,50 @@ def log(msg):
         f.write(f"[{timestamp}] {msg}\n")
     print(f"[{timestamp}] {msg}")
 
+class _LogHandler(logging.Handler):
+    """Write log records (e.g. vendor_router's parser crashes) through log()"""
+    def emit(self, record):
+        log(self.format(record))
+
+vendor_router.logger.addHandler(_LogHandler())
+
 def connect_imap():
     mail = imaplib.IMAP4_SSL(IMAP_SERVER)
     mail.login(EMAIL_USER, EMAIL_PASS)
     return mail
 
+# Vendor keywords, in priority order when more than one vendor is mentioned
+VENDOR_KEYWORDS = {
+    'epic': ['epic', 'epic dental', 'epicdentallab'],
+    'patterson': ['patterson', 'patterson dental'],
+    'henry': ['henry', 'henry schein'],
+    'exodus': ['exodus', 'exodus dental'],
+    'artisan': ['artisan', 'artisan dental'],
+    'tc': ['tc dental', 'tc dental lab']
+}
+
+# One alternation for all vendors; the named group of each match is the vendor
+_VENDOR_KEYWORD_RE = re.compile('|'.join(
+    f"(?P<{vendor}>" + '|'.join(re.escape(k) for k in keywords) + ")"
+    for vendor, keywords in VENDOR_KEYWORDS.items()
+))
+
+def match_vendor(text):
+    """Return the highest-priority vendor with a keyword in text, or None"""
+    found = {match.lastgroup for match in _VENDOR_KEYWORD_RE.finditer(text)}
+    return next((vendor for vendor in VENDOR_KEYWORDS if vendor in found), None)
+
 def detect_vendor_from_email(msg):
     """Detect vendor from email sender, subject, or body"""
-    vendor_keywords = {
-        'epic': ['epic', 'epic dental', 'epicdentallab'],
-        'patterson': ['patterson', 'patterson dental'],
-        'henry': ['henry', 'henry schein'],
-        'exodus': ['exodus', 'exodus dental'],
-        'artisan': ['artisan', 'artisan dental'],
-        'tc': ['tc dental', 'tc dental lab']
-    }
-    
     # Check sender email
-    sender = msg.get('From', '').lower()
-    for vendor, keywords in vendor_keywords.items():
-        if any(keyword in sender for keyword in keywords):
-            return vendor
+    vendor = match_vendor(msg.get('From', '').lower())
+    if vendor:
+        return vendor
     
     # Check subject
-    subject = msg.get('Subject', '').lower()
-    for vendor, keywords in vendor_keywords.items():
-        if any(keyword in subject for keyword in keywords):
-            return vendor
+    vendor = match_vendor(msg.get('Subject', '').lower())
+    if vendor:
+        return vendor
     
     # Check email body
     body = ""
@@ -61,27 +80,23 @@ def detect_vendor_from_email(msg):
     else:
         body = msg.get_payload(decode=True).decode('utf-8', errors='ignore').lower()
     
-    for vendor, keywords in vendor_keywords.items():
-        if any(keyword in body for keyword in keywords):
-            return vendor
-    
-    return None
+    return match_vendor(body)
 
 def run_vendor_router(filepath, detected_vendor=None):
+    # Routed through vendor_router's persistent worker processes: the
+    # parsers are imported once, and a parser that hangs past
+    # PARSER_TIMEOUT or crashes its worker can't take the watcher down.
+    # Why a PDF went unrouted (each parser's exception, timeout or
+    # rejection) reaches log.txt through vendor_router's logger.
     try:
-        cmd = ["python3", VENDOR_ROUTER_PATH, filepath]
-        if detected_vendor:
-            cmd.append(detected_vendor)
-        
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        if result.returncode == 0:
-            vendor_name = result.stdout.strip()
+        vendor_name = vendor_router.route_pdf(filepath, detected_vendor)
+        if vendor_name:
             log(f"🔍 Vendor detected: {vendor_name}")
             return vendor_name
         else:
-            log(f"❌ Router error: {result.stderr.strip()}")
-    except Exception as e:
-        log(f"❌ Exception in router: {e}")
+            log(f"❌ No vendor parser accepted {os.path.basename(filepath)}")
+    except Exception:
+        log(f"❌ Exception in router:\n{traceback.format_exc().rstrip()}")
     return None
 
 def process_attachments(msg):
@@ -8,6 +8,8 @@ import os
 import json
 from datetime import datetime
 
+from invoice_queue_writer import locked_queue, write_queue_file
+
 def final_clean():
     """Keep only the 7 Henry Schein invoices with matching email_* PDFs"""
     
@@ -44,8 +46,7 @@ def final_clean():
             print(f"🗑️ Removed: {entry.get('invoice_number', 'Unknown')} - {entry.get('vendor', 'Unknown')}")
     
     # Save cleaned queue
-    with open(queue_file, 'w') as f:
-        json.dump(cleaned_queue, f, indent=2)
+    write_queue_file(queue_file, cleaned_queue)
     
     print("=" * 50)
     print(f"📊 FINAL CLEANING COMPLETE")
@@ -64,7 +65,9 @@ def main():
     print("🎯 PCS AI - Final Clean")
     print("=" * 50)
     
-    final_clean()
+    # Hold the queue lock for the whole read-clean-write pass
+    with locked_queue("invoice_queue.json"):
+        final_clean()
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -28,11 +28,15 @@ def run_component(component_name, script_path):
     """Run a component in a separate process"""
     log(f"🚀 Starting {component_name}...")
     try:
+        # Nothing reads the output (each component keeps its own log), and an
+        # unread pipe would stall the component once its buffer filled
         process = subprocess.Popen(
             [sys.executable, script_path],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            # Our descriptors are non-inheritable anyway; leaving close_fds
+            # off lets subprocess use posix_spawn instead of fork+exec
+            close_fds=False
         )
         log(f"✅ {component_name} started (PID: {process.pid})")
         return process
@@ -43,13 +47,13 @@ def run_component(component_name, script_path):
 def monitor_process(component_name, process):
     """Monitor a process and restart if it dies"""
     while True:
-        if process.poll() is not None:
-            log(f"⚠️ {component_name} stopped, restarting...")
-            process = run_component(component_name, process.args[1])
-            if not process:
-                log(f"❌ Failed to restart {component_name}")
-                break
-        time.sleep(5)
+        # Block until the process exits instead of polling on a timer
+        process.wait()
+        log(f"⚠️ {component_name} stopped, restarting...")
+        process = run_component(component_name, process.args[1])
+        if not process:
+            log(f"❌ Failed to restart {component_name}")
+            break
 
 def create_directories():
     """Create necessary directories"""
@@ -10,6 +10,8 @@ import re
 from collections import defaultdict
 from typing import Dict, List, Tuple
 
+from invoice_queue_writer import locked_queue, write_queue_file
+
 # Hard-coded vendor categories
 HARDCODED_VENDOR_CATEGORIES = {
     "Exodus Dental Solutions": "Dental Lab",
@@ -81,67 +83,114 @@ CATEGORY_KEYWORDS = {
     ]
 }
 
+# Categories in a fixed order so per-category accumulators can be plain lists
+CATEGORIES: Tuple[str, ...] = tuple(CATEGORY_KEYWORDS.keys())
+CATEGORY_INDEX: Dict[str, int] = {category: i for i, category in enumerate(CATEGORIES)}
+
+# Keyword table lowered once at import: (keyword, category index) in CATEGORY_KEYWORDS order
+KEYWORD_TABLE: Tuple[Tuple[str, int], ...] = tuple(
+    (keyword.lower(), CATEGORY_INDEX[category])
+    for category, keywords in CATEGORY_KEYWORDS.items()
+    for keyword in keywords
+)
+
 def normalize_text(text: str) -> str:
     """Normalize text for better matching."""
     if not text:
         return ""
     return re.sub(r'[^\w\s]', ' ', text.lower()).strip()
 
-def calculate_category_score(item_text: str, item_cost: float) -> Dict[str, float]:
-    """Calculate category scores for a line item based on keywords and cost."""
-    normalized_text = normalize_text(item_text)
-    scores = defaultdict(float)
+def match_category_keywords(normalized_text: str) -> List[float]:
+    """Sum the keyword match scores per category index for already-normalized text."""
+    scores = [0.0] * len(CATEGORIES)
+    tokens = set(normalized_text.split())
     
-    for category, keywords in CATEGORY_KEYWORDS.items():
-        for keyword in keywords:
-            if keyword.lower() in normalized_text:
-                # Base score for keyword match
-                base_score = 1.0
-                
-                # Boost score for exact matches
-                if keyword.lower() == normalized_text:
-                    base_score = 3.0
-                elif keyword.lower() in normalized_text.split():
-                    base_score = 2.0
-                
-                # Weight by cost (more expensive items get higher scores)
-                cost_multiplier = min(item_cost / 10.0, 5.0)  # Cap at 5x multiplier
-                scores[category] += base_score * cost_multiplier
+    for keyword, category_idx in KEYWORD_TABLE:
+        if keyword in normalized_text:
+            # Boost score for exact matches, then whole-word matches
+            if keyword == normalized_text:
+                scores[category_idx] += 3.0
+            elif keyword in tokens:
+                scores[category_idx] += 2.0
+            else:
+                scores[category_idx] += 1.0
     
-    return dict(scores)
+    return scores
+
+def cost_multiplier(item_cost: float) -> float:
+    """Weight by cost (more expensive items get higher scores), capped at 5x."""
+    return min(item_cost / 10.0, 5.0)
+
+def calculate_category_score(item_text: str, item_cost: float) -> Dict[str, float]:
+    """Calculate category scores for a line item based on keywords and cost."""
+    multiplier = cost_multiplier(item_cost)
+    base_scores = match_category_keywords(normalize_text(item_text))
+    return {
+        CATEGORIES[i]: base_score * multiplier
+        for i, base_score in enumerate(base_scores)
+        if base_score
+    }
+
+def reduce_category_matches(
+    match_items: List[int],
+    match_categories: List[int],
+    match_scores: List[float],
+    costs: List[float],
+    multipliers: List[float],
+) -> Tuple[List[float], List[float]]:
+    """Reduce flat keyword matches into per-category cost totals and weighted scores.
+
+    Matches must be in item order. Each one is weighted by its own item's cost
+    multiplier before it is added, as calculate_category_score does, so the
+    float sums come out exactly as when scoring item by item.
+    """
+    category_totals = [0.0] * len(CATEGORIES)
+    category_scores = [0.0] * len(CATEGORIES)
+    for k in range(len(match_items)):
+        i = match_items[k]
+        c = match_categories[k]
+        category_scores[c] += match_scores[k] * multipliers[i]
+        category_totals[c] += costs[i]
+    return category_totals, category_scores
 
 def categorize_line_items(line_items: List[Dict]) -> str:
     """Categorize an invoice based on its line items with cost prioritization."""
     if not line_items:
         return "Other"
     
-    category_totals = defaultdict(float)
-    category_scores = defaultdict(float)
+    # Convert the line items into parallel arrays once
+    costs = [float(item.get('line_item_total', 0)) for item in line_items]
+    texts = [
+        normalize_text(f"{item.get('product_name', '')} {item.get('product_number', '')}".strip())
+        for item in line_items
+    ]
+    multipliers = [cost_multiplier(cost) for cost in costs]
     
-    for item in line_items:
-        product_name = item.get('product_name', '')
-        product_number = item.get('product_number', '')
-        line_total = float(item.get('line_item_total', 0))
-        
-        # Combine product name and number for analysis
-        item_text = f"{product_name} {product_number}".strip()
-        
-        # Calculate category scores for this item
-        item_scores = calculate_category_score(item_text, line_total)
-        
-        # Add to category totals and scores
-        for category, score in item_scores.items():
-            category_scores[category] += score
-            category_totals[category] += line_total
+    # Match every item first, producing flat (item, category, base score) arrays
+    match_items: List[int] = []
+    match_categories: List[int] = []
+    match_scores: List[float] = []
+    for i, text in enumerate(texts):
+        for c, base_score in enumerate(match_category_keywords(text)):
+            if base_score:
+                match_items.append(i)
+                match_categories.append(c)
+                match_scores.append(base_score)
     
     # If no categories matched, return "Other"
-    if not category_scores:
+    if not match_items:
         return "Other"
     
-    # Prioritize by total cost first, then by keyword scores
-    best_category = max(category_totals.items(), key=lambda x: (x[1], category_scores.get(x[0], 0)))
+    category_totals, category_scores = reduce_category_matches(
+        match_items, match_categories, match_scores, costs, multipliers
+    )
     
-    return best_category[0]
+    # Prioritize by total cost first, then by keyword scores, among matched
+    # categories; a full tie goes to the category matched first
+    matched = dict.fromkeys(match_categories)
+    best = max(matched, key=lambda c: (category_totals[c], category_scores[c]))
+    
+    return CATEGORIES[best]
 
 def categorize_invoice(vendor: str, line_items: List[Dict]) -> str:
     """Categorize an invoice using hard-coded vendor categories or smart line item detection."""
@@ -152,6 +201,22 @@ def categorize_invoice(vendor: str, line_items: List[Dict]) -> str:
     # If no hard-coded category, use smart line item detection
     return categorize_line_items(line_items)
 
+def existing_files(paths: List[str]) -> set:
+    """Return the subset of ``paths`` that exist, listing each parent directory once."""
+    paths_by_dir = defaultdict(list)
+    for path in paths:
+        paths_by_dir[os.path.dirname(path)].append(path)
+    
+    existing = set()
+    for directory, dir_paths in paths_by_dir.items():
+        try:
+            with os.scandir(directory or '.') as entries:
+                names = {entry.name for entry in entries if entry.is_file()}
+        except OSError:
+            continue
+        existing.update(path for path in dir_paths if os.path.basename(path) in names)
+    return existing
+
 def update_invoice_categories():
     """Update all invoices in the queue with proper categories."""
     queue_file = "invoice_queue.json"
@@ -160,6 +225,12 @@ def update_invoice_categories():
         print("❌ invoice_queue.json not found")
         return
     
+    # Hold the queue lock from reading the queue until it is saved
+    with locked_queue(queue_file):
+        _categorize_queue(queue_file)
+
+def _categorize_queue(queue_file):
+    """Categorize the invoices in queue_file and save it; the caller holds the queue lock."""
     # Load current queue
     with open(queue_file, 'r') as f:
         queue = json.load(f)
@@ -167,12 +238,15 @@ def update_invoice_categories():
     print(f"📋 Processing {len(queue)} invoices for categorization...")
     print(f"🏷️  Hard-coded vendors: {list(HARDCODED_VENDOR_CATEGORIES.keys())}")
     
+    # One directory listing per JSON folder instead of a stat per invoice
+    available_jsons = existing_files([inv['json_path'] for inv in queue if inv.get('json_path')])
+    
     updated_count = 0
     for invoice in queue:
         json_path = invoice.get('json_path', '')
         vendor = invoice.get('vendor', '')
         
-        if not json_path or not os.path.exists(json_path):
+        if not json_path or json_path not in available_jsons:
             continue
         
         try:
@@ -207,8 +281,7 @@ def update_invoice_categories():
             invoice['category'] = "Other"
     
     # Save updated queue
-    with open(queue_file, 'w') as f:
-        json.dump(queue, f, indent=2)
+    write_queue_file(queue_file, queue)
     
     print(f"\n🎯 Categorization complete!")
     print(f"✅ Updated {updated_count} invoices")
@@ -244,7 +317,7 @@ def test_categorization():
         scores = calculate_category_score(item_text, float(item['line_item_total']))
         print(f"  {item_text}: {scores}")
 
-if __name__ == "__main__":
+def main():
     print("🎯 Invoice Categorizer (Hybrid: Hard-coded + Smart Detection)")
     print("=" * 70)
     
@@ -254,4 +327,7 @@ if __name__ == "__main__":
     print("\n" + "=" * 70)
     
     # Update all invoices
-    update_invoice_categories() 
\ No newline at end of file
+    update_invoice_categories()
+
+if __name__ == "__main__":
+    main() 
\ No newline at end of file
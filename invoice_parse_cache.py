@@ -0,0 +1,134 @@
+"""Disk-backed cache of parsed invoice results, keyed on PDF content.
+
+Invoice PDFs never change once they arrive, yet batch scripts re-run the
+parsers over the same files again and again.  ``content_cached`` wraps a
+``parse_*(pdf_path)`` function so that the first parse of a PDF is stored as
+JSON under ``.invoice_cache/`` and later calls with identical bytes load that
+JSON instead of parsing again.
+
+The cache key is the SHA-256 of the PDF bytes combined with the SHA-256 of
+the parser's source file, so editing a parser invalidates its old results.
+Only successful ``dict`` results are cached; exceptions and ``None`` results
+always go through to the parser.
+
+The router also records which vendor's parser succeeded for a PDF
+(``remember_vendor``/``cached_vendor``), so a resubmitted invoice goes
+straight to that parser without vendor detection or OCR, and batch scripts
+record the output JSON written for a PDF (``remember_output``/
+``cached_output``), so a forwarded or re-sent copy isn't parsed again.
+"""
+
+import functools
+import hashlib
+import inspect
+import json
+import os
+from typing import Any, Callable, Dict, Optional
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".invoice_cache")
+VENDOR_CACHE_DIR = os.path.join(CACHE_DIR, "vendors")
+OUTPUT_CACHE_DIR = os.path.join(CACHE_DIR, "outputs")
+
+
+def _sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def content_cached(parse_func: Callable[[str], Optional[Dict[str, Any]]]):
+    """Decorate a ``parse_*(pdf_path)`` function with the content-keyed disk cache."""
+    source_path = inspect.getsourcefile(parse_func)
+    parser_version = _sha256_file(source_path)[:16] if source_path else "unknown"
+    cache_dir = os.path.join(CACHE_DIR, f"{parse_func.__module__}.{parse_func.__name__}")
+
+    @functools.wraps(parse_func)
+    def wrapper(pdf_path: str, *args, **kwargs):
+        if args or kwargs:
+            return parse_func(pdf_path, *args, **kwargs)
+        try:
+            pdf_digest = _sha256_file(os.path.expanduser(pdf_path))
+        except OSError:
+            # Missing/unreadable file: let the parser raise its usual error
+            return parse_func(pdf_path)
+
+        cache_path = os.path.join(cache_dir, f"{pdf_digest}-{parser_version}.json")
+        try:
+            with open(cache_path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            pass
+
+        result = parse_func(pdf_path)
+        if isinstance(result, dict):
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+                tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+                with open(tmp_path, "w") as f:
+                    json.dump(result, f)
+                os.replace(tmp_path, cache_path)
+            except (OSError, TypeError, ValueError) as e:
+                print(f"⚠️ Could not cache parse result for {pdf_path}: {e}")
+        return result
+
+    return wrapper
+
+
+def pdf_digest(pdf_path: str) -> Optional[str]:
+    """SHA-256 of the PDF's bytes, or ``None`` if it can't be read."""
+    try:
+        return _sha256_file(os.path.expanduser(pdf_path))
+    except OSError:
+        return None
+
+
+def bytes_digest(pdf_bytes: bytes) -> str:
+    """SHA-256 of PDF bytes already in memory; matches ``pdf_digest``."""
+    return hashlib.sha256(pdf_bytes).hexdigest()
+
+
+def _read_record(record_dir: str, digest: Optional[str]) -> Optional[str]:
+    if digest is None:
+        return None
+    try:
+        with open(os.path.join(record_dir, digest), "r") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def _write_record(record_dir: str, digest: Optional[str], value: str) -> None:
+    if digest is None:
+        return
+    record_path = os.path.join(record_dir, digest)
+    try:
+        os.makedirs(record_dir, exist_ok=True)
+        tmp_path = f"{record_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(value)
+        os.replace(tmp_path, record_path)
+    except OSError as e:
+        print(f"⚠️ Could not write cache record {record_path}: {e}")
+
+
+def cached_vendor(digest: Optional[str]) -> Optional[str]:
+    """Return the vendor recorded for a PDF digest, if any."""
+    return _read_record(VENDOR_CACHE_DIR, digest)
+
+
+def remember_vendor(digest: Optional[str], vendor: str) -> None:
+    """Record that ``vendor``'s parser handled the PDF with this digest."""
+    _write_record(VENDOR_CACHE_DIR, digest, vendor)
+
+
+def cached_output(digest: Optional[str]) -> Optional[str]:
+    """Return the output JSON recorded for a PDF digest, if it still exists."""
+    json_path = _read_record(OUTPUT_CACHE_DIR, digest)
+    return json_path if json_path and os.path.exists(json_path) else None
+
+
+def remember_output(digest: Optional[str], json_path: str) -> None:
+    """Record the output JSON written for the PDF with this digest."""
+    _write_record(OUTPUT_CACHE_DIR, digest, os.path.abspath(json_path))
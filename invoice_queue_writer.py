@@ -4,35 +4,105 @@ Invoice Queue Writer - Monitors output_jsons directory and adds new invoices to
 """
 
 import os
-import json
+import sys
+import orjson
 import time
-import glob
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # Windows: no advisory file locks
+
 # Configuration
 OUTPUT_JSONS_PATH = os.path.join(os.path.dirname(__file__), "output_jsons")
 INVOICE_QUEUE_PATH = os.path.join(os.path.dirname(__file__), "invoice_queue.json")
 EMAIL_INVOICES_PATH = os.path.join(os.path.dirname(__file__), "email_invoices")
 LOG_PATH = os.path.join(os.path.dirname(__file__), "queue_writer.log")
+JSON_READ_WORKERS = 16  # threads reading new output JSONs
+
+# Canonical display names keyed by the lowercased vendor field the parsers emit
+VENDOR_CANONICAL_NAMES = {
+    'henry schein': 'Henry Schein',
+    'epic dental lab': 'Epic Dental Lab',
+    # Vendor ids the Patterson, Exodus, Artisan and TC parsers emit, mapped to
+    # the names in HARDCODED_VENDOR_CATEGORIES
+    'patterson_dental': 'Patterson Dental',
+    'exodus_dental_solutions': 'Exodus Dental Solutions',
+    'artisan dental laboratory': 'Artisan Dental',
+    'tc dental laboratory, inc.': 'TC Dental Lab',
+}
+
+# Single persistent log file handle plus console output
+logger = logging.getLogger("queue_writer")
+logger.setLevel(logging.INFO)
+logger.propagate = False
+if not logger.handlers:
+    _formatter = logging.Formatter("[%(asctime)s] %(message)s", datefmt="%Y-%m-%dT%H:%M:%S")
+    for _handler in (logging.FileHandler(LOG_PATH, delay=True), logging.StreamHandler(sys.stdout)):
+        _handler.setFormatter(_formatter)
+        logger.addHandler(_handler)
 
-def log(msg):
-    """Log messages with timestamp"""
-    timestamp = datetime.now().isoformat()
-    with open(LOG_PATH, "a") as f:
-        f.write(f"[{timestamp}] {msg}\n")
-    print(f"[{timestamp}] {msg}")
+log = logger.info
 
 def load_invoice_queue():
     """Load invoice queue from file"""
     if os.path.exists(INVOICE_QUEUE_PATH):
-        with open(INVOICE_QUEUE_PATH, 'r') as f:
-            return json.load(f)
+        with open(INVOICE_QUEUE_PATH, 'rb') as f:
+            return orjson.loads(f.read())
     return []
 
+def write_queue_file(queue_path, queue):
+    """Write a queue to disk via a temp file, fsync and rename.
+
+    Every queue writer goes through here, so a crash never leaves the queue
+    truncated and its bytes don't depend on which writer ran last.
+    """
+    _write_queue_bytes(queue_path, orjson.dumps(queue, option=orjson.OPT_INDENT_2))
+
+def _write_queue_bytes(queue_path, data):
+    tmp_path = f"{queue_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, queue_path)
+
+def write_queue_if_changed(queue_path, queue):
+    """Write the queue like write_queue_file, unless the file already has these bytes.
+
+    Returns True if the file was rewritten.
+    """
+    new_bytes = orjson.dumps(queue, option=orjson.OPT_INDENT_2)
+    try:
+        with open(queue_path, 'rb') as f:
+            if f.read() == new_bytes:
+                return False
+    except OSError:
+        pass
+    _write_queue_bytes(queue_path, new_bytes)
+    return True
+
+@contextmanager
+def locked_queue(queue_path=INVOICE_QUEUE_PATH):
+    """Hold the queue's exclusive lock for a read-modify-write of the queue.
+
+    The lock is an flock on the sidecar ``<queue>.lock`` file, since every
+    write replaces the queue file itself. All queue writers load, update and
+    save the queue inside this block, so none can replace the queue with a
+    stale copy that drops another writer's changes. Not reentrant.
+    """
+    with open(queue_path + ".lock", 'a') as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
 def save_invoice_queue(queue):
     """Save invoice queue to file"""
-    with open(INVOICE_QUEUE_PATH, 'w') as f:
-        json.dump(queue, f, indent=2)
+    write_queue_file(INVOICE_QUEUE_PATH, queue)
 
 def detect_vendor_from_filename(filename):
     """Detect vendor from filename"""
@@ -53,12 +123,37 @@ def detect_vendor_from_filename(filename):
     else:
         return 'unknown'
 
-def add_invoice_to_queue(json_file_path):
-    """Add invoice to queue"""
+def read_invoice_json(json_file_path):
+    """Read a parsed invoice JSON, or None if it cannot be read"""
+    try:
+        with open(json_file_path, 'rb') as f:
+            return orjson.loads(f.read())
+    except (OSError, ValueError):
+        return None
+
+def add_invoice_to_queue(json_file_path, queue=None, queued_numbers=None, invoice_data=None):
+    """Add invoice to queue
+
+    When ``queue`` is passed the entry is appended in memory and the caller,
+    holding locked_queue, saves the queue once for the whole batch; otherwise
+    the queue file is loaded and rewritten under the lock for this single
+    invoice. ``invoice_data`` may carry
+    the already-loaded JSON so the file is not read again.
+    """
     try:
+        # Standalone: load, add and save the queue under the queue lock
+        if queue is None:
+            with locked_queue():
+                queue = load_invoice_queue()
+                added = add_invoice_to_queue(json_file_path, queue, queued_numbers, invoice_data)
+                if added:
+                    save_invoice_queue(queue)
+                return added
+        
         # Load the JSON file to get invoice data
-        with open(json_file_path, 'r') as f:
-            invoice_data = json.load(f)
+        if invoice_data is None:
+            with open(json_file_path, 'rb') as f:
+                invoice_data = orjson.loads(f.read())
         
         # Extract invoice information
         invoice_number = invoice_data.get('invoice_number', '')
@@ -68,10 +163,7 @@ def add_invoice_to_queue(json_file_path):
         invoice_date = invoice_data.get('invoice_date', '')
         
         # Normalize vendor name
-        if vendor.lower() in ['henry schein', 'henry schein']:
-            vendor = 'Henry Schein'
-        elif vendor.lower() == 'epic dental lab':
-            vendor = 'Epic Dental Lab'
+        vendor = VENDOR_CANONICAL_NAMES.get(vendor.lower(), vendor)
         
         # Create PDF path
         json_filename = os.path.basename(json_file_path)
@@ -93,18 +185,17 @@ def add_invoice_to_queue(json_file_path):
             "approved": False
         }
         
-        # Load current queue
-        queue = load_invoice_queue()
+        if queued_numbers is None:
+            queued_numbers = {inv.get('invoice_number') for inv in queue}
         
         # Check if invoice already exists
-        existing_invoices = [inv for inv in queue if inv.get('invoice_number') == invoice_number]
-        if existing_invoices:
+        if invoice_number in queued_numbers:
             log(f"⚠️ Invoice {invoice_number} already in queue, skipping")
             return False
         
-        # Add to queue
+        # Add to queue; the caller saves it
         queue.append(queue_entry)
-        save_invoice_queue(queue)
+        queued_numbers.add(invoice_number)
         
         log(f"✅ Added invoice {invoice_number} to queue")
         log(f"📊 Vendor: {vendor}")
@@ -119,26 +210,42 @@ def add_invoice_to_queue(json_file_path):
 
 def process_new_json_files():
     """Process new JSON files in output_jsons directory"""
-    if not os.path.exists(OUTPUT_JSONS_PATH):
+    # Get all JSON files from a single directory read
+    try:
+        with os.scandir(OUTPUT_JSONS_PATH) as entries:
+            json_files = [
+                entry.path for entry in entries
+                if entry.name.endswith('.json') and not entry.name.startswith('.')
+                and entry.is_file(follow_symlinks=False)
+            ]
+    except FileNotFoundError:
         log(f"❌ Output directory not found: {OUTPUT_JSONS_PATH}")
         return
     
-    # Get all JSON files
-    json_files = glob.glob(os.path.join(OUTPUT_JSONS_PATH, "*.json"))
-    
-    # Load current queue to check what's already processed
-    queue = load_invoice_queue()
-    processed_files = {entry.get('json_path') for entry in queue}
-    
-    # Process new files
-    new_files = [f for f in json_files if f not in processed_files]
-    
-    if new_files:
-        log(f"📄 Found {len(new_files)} new JSON files to process")
-        for json_file in new_files:
-            add_invoice_to_queue(json_file)
-    else:
-        log("📄 No new JSON files found")
+    # Hold the queue lock from reading the queue until the batch is saved
+    with locked_queue():
+        # Load current queue to check what's already processed
+        queue = load_invoice_queue()
+        processed_files = {entry.get('json_path') for entry in queue}
+        queued_numbers = {entry.get('invoice_number') for entry in queue}
+        
+        # Process new files
+        new_files = [f for f in json_files if f not in processed_files]
+        
+        if new_files:
+            log(f"📄 Found {len(new_files)} new JSON files to process")
+            # Read the new JSONs concurrently; each is a small independent read
+            with ThreadPoolExecutor(max_workers=JSON_READ_WORKERS) as executor:
+                invoice_datas = list(executor.map(read_invoice_json, new_files))
+            added = 0
+            for json_file, invoice_data in zip(new_files, invoice_datas):
+                if add_invoice_to_queue(json_file, queue, queued_numbers, invoice_data):
+                    added += 1
+            # Write the queue once for the whole batch
+            if added:
+                save_invoice_queue(queue)
+        else:
+            log("📄 No new JSON files found")
 
 def main():
     """Main function"""
@@ -23,17 +23,45 @@ Usage::
 
     python json_diff_bot.py original_output.json corrected_output.json
 
-It will print the diff result as formatted JSON to stdout.
+It streams the diff result to stdout as a JSON array, one change per line.
 """
 
 import json
 import sys
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterator, Optional
+
+import orjson
+
+
+def _fingerprint(node: Any) -> bytes:
+    """Canonical serialisation of a JSON subtree, used to spot unchanged subtrees.
+
+    Unlike ``==`` this keeps ``1``/``1.0``/``True`` apart, matching the
+    string comparison applied to leaves below. orjson writes NaN and
+    +/-Infinity as ``null``, though, so equal fingerprints alone don't prove
+    two subtrees equal; see ``_unchanged``.
+    """
+    return orjson.dumps(node, option=orjson.OPT_SORT_KEYS)
+
+
+def _unchanged(original: Any, corrected: Any) -> bool:
+    """Return True when two JSON subtrees are guaranteed to produce no diffs."""
+    if original is corrected:
+        return True
+    if type(original) is not type(corrected):
+        return False
+    if isinstance(original, (dict, list)):
+        # ``==`` tells NaN/Infinity from null, which the fingerprint can't
+        try:
+            return _fingerprint(original) == _fingerprint(corrected) and original == corrected
+        except (TypeError, orjson.JSONEncodeError):
+            return False
+    return False
 
 
 def diff_json(
     original: Any, corrected: Any, path: str = ""
-) -> List[Dict[str, Optional[str]]]:
+) -> Iterator[Dict[str, Optional[str]]]:
     """Recursively compute differences between two JSON structures.
 
     Args:
@@ -42,11 +70,13 @@ def diff_json(
         path: Dot/bracket notation indicating the current location within the
             JSON structure (used for building field paths).
 
-    Returns:
-        A list of dictionaries, each describing a change with keys
-        ``field``, ``before``, and ``after``.
+    Yields:
+        Dictionaries, each describing a change with keys ``field``,
+        ``before``, and ``after``, in the order they are found.
     """
-    differences: List[Dict[str, Optional[str]]] = []
+    # Identical subtrees (e.g. untouched line items) need no walk at all
+    if _unchanged(original, corrected):
+        return
 
     # If both are dicts, iterate over the union of keys
     if isinstance(original, dict) and isinstance(corrected, dict):
@@ -59,25 +89,21 @@ def diff_json(
 
             if not in_original:
                 # Key only exists in corrected
-                differences.append(
-                    {
-                        "field": new_path,
-                        "before": None,
-                        "after": str(corrected[key]) if corrected[key] is not None else None,
-                    }
-                )
+                yield {
+                    "field": new_path,
+                    "before": None,
+                    "after": str(corrected[key]) if corrected[key] is not None else None,
+                }
             elif not in_corrected:
                 # Key only exists in original
-                differences.append(
-                    {
-                        "field": new_path,
-                        "before": str(original[key]) if original[key] is not None else None,
-                        "after": None,
-                    }
-                )
+                yield {
+                    "field": new_path,
+                    "before": str(original[key]) if original[key] is not None else None,
+                    "after": None,
+                }
             else:
                 # Recurse into shared keys
-                differences.extend(diff_json(original[key], corrected[key], new_path))
+                yield from diff_json(original[key], corrected[key], new_path)
 
     # If both are lists, compare by index
     elif isinstance(original, list) and isinstance(corrected, list):
@@ -91,26 +117,22 @@ def diff_json(
             if not in_original:
                 # Element only exists in corrected
                 value = corrected[index]
-                differences.append(
-                    {
-                        "field": new_path,
-                        "before": None,
-                        "after": str(value) if value is not None else None,
-                    }
-                )
+                yield {
+                    "field": new_path,
+                    "before": None,
+                    "after": str(value) if value is not None else None,
+                }
             elif not in_corrected:
                 # Element only exists in original
                 value = original[index]
-                differences.append(
-                    {
-                        "field": new_path,
-                        "before": str(value) if value is not None else None,
-                        "after": None,
-                    }
-                )
+                yield {
+                    "field": new_path,
+                    "before": str(value) if value is not None else None,
+                    "after": None,
+                }
             else:
                 # Both have an element at this index; recurse
-                differences.extend(diff_json(original[index], corrected[index], new_path))
+                yield from diff_json(original[index], corrected[index], new_path)
 
     else:
         # At this point, original and corrected are not both dicts or lists.
@@ -120,9 +142,7 @@ def diff_json(
 
         # Record a difference only if the string representations differ.
         if before != after:
-            differences.append({"field": path, "before": before, "after": after})
-
-    return differences
+            yield {"field": path, "before": before, "after": after}
 
 
 def main() -> None:
@@ -152,11 +172,15 @@ def main() -> None:
         print(f"Failed to load corrected JSON file '{corrected_path}': {exc}", file=sys.stderr)
         sys.exit(1)
 
-    # Compute differences
-    diffs = diff_json(original_data, corrected_data)
-
-    # Print results as formatted JSON
-    json.dump(diffs, sys.stdout, indent=2)
+    # Stream each difference as soon as it is found instead of building the list
+    out = sys.stdout
+    out.write("[")
+    separator = "\n  "
+    for diff in diff_json(original_data, corrected_data):
+        out.write(separator)
+        out.write(orjson.dumps(diff).decode())
+        separator = ",\n  "
+    out.write("\n]\n" if separator != "\n  " else "]\n")
 
 
 if __name__ == "__main__":
@@ -1,8 +1,11 @@
 from PIL import Image
 import pytesseract
 
-img = Image.open("converted/epic_invoice_6_page-1.png")
-text = pytesseract.image_to_string(img)
+# Single uniform text block, LSTM engine only, English pinned
+TESSERACT_CONFIG = "--oem 1 --psm 6"
+
+img = Image.open("converted/epic_invoice_6_page-1.png").convert("L")
+text = pytesseract.image_to_string(img, lang="eng", config=TESSERACT_CONFIG)
 
 with open("ocr_output.txt", "w") as f:
     f.write(text)
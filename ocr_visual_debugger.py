@@ -1,25 +1,52 @@
 import cv2
+import numpy as np
 import pytesseract
-import pandas as pd
 import argparse
+import csv
 import os
 
+OCR_COLUMNS = ["level", "page_num", "block_num", "par_num", "line_num", "word_num",
+               "left", "top", "width", "height", "conf", "text"]
+
+# Single uniform text block, LSTM engine only, English pinned
+TESSERACT_CONFIG = "--oem 1 --psm 6"
+
 def debug_ocr_image(image_path: str, out_csv: str, out_img: str):
     image = cv2.imread(image_path)
-    d = pytesseract.image_to_data(image, output_type=pytesseract.Output.DATAFRAME)
-    d = d.dropna().reset_index(drop=True)
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    d = pytesseract.image_to_data(gray, lang="eng", config=TESSERACT_CONFIG,
+                                  output_type=pytesseract.Output.DICT)
+
+    # Keep only rows that carry a recognised word
+    rows = [i for i in range(len(d['text'])) if d['text'][i] and d['text'][i].strip()]
 
     # Save raw OCR output to CSV
-    d.to_csv(out_csv, index=False)
+    with open(out_csv, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(OCR_COLUMNS)
+        writer.writerows([d[col][i] for col in OCR_COLUMNS] for i in rows)
     print(f"✅ OCR data saved to: {out_csv}")
 
-    # Draw bounding boxes for each word
-    for i, row in d.iterrows():
-        (x, y, w, h) = (int(row['left']), int(row['top']), int(row['width']), int(row['height']))
-        text = row['text']
-        if int(row['conf']) > 30:
-            cv2.rectangle(image, (x, y), (x + w, y + h), (0, 255, 0), 1)
-            cv2.putText(image, text, (x, y - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.4, (0, 0, 255), 1)
+    # Keep confident words only, then draw every bounding box in one call
+    idx = np.asarray(rows, dtype=np.intp)
+    conf = np.asarray(d['conf'], dtype=np.float64)[idx]
+    keep = idx[conf.astype(np.int64) > 30]
+    x = np.asarray(d['left'], dtype=np.int32)[keep]
+    y = np.asarray(d['top'], dtype=np.int32)[keep]
+    w = np.asarray(d['width'], dtype=np.int32)[keep]
+    h = np.asarray(d['height'], dtype=np.int32)[keep]
+    boxes = np.stack([
+        np.stack([x, y], axis=1),
+        np.stack([x + w, y], axis=1),
+        np.stack([x + w, y + h], axis=1),
+        np.stack([x, y + h], axis=1),
+    ], axis=1)
+    if len(boxes):
+        cv2.polylines(image, list(boxes), True, (0, 255, 0), 1)
+
+    # putText has no batch form, so label the prefiltered words one by one
+    for i, bx, by in zip(keep.tolist(), x.tolist(), y.tolist()):
+        cv2.putText(image, d['text'][i], (bx, by - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.4, (0, 0, 255), 1)
 
     cv2.imwrite(out_img, image)
     print(f"🖼️ Annotated image saved to: {out_img}")
@@ -1,9 +1,53 @@
 import fitz
 import re
-import collections
+import itertools
 import json
+import sys
 from typing import List, Dict, Any
 
+from invoice_parse_cache import content_cached
+
+# Patterns used by parse_invoice, compiled once at import
+_AMOUNT = re.compile(r'\d+\.\d{2}')
+# Invoice date (MM/DD/YYYY) and invoice number (IN followed by digits) in one
+# scan; both are word-bounded, so neither can hide a match of the other
+_HEADER_FIELDS = re.compile(r'(?P<invoice_date>\b\d{2}/\d{2}/\d{4}\b)|(?P<invoice_number>\bIN\d+\b)')
+_CITY_STATE_ZIP = re.compile(r'([A-Za-z]+(?:\s+[A-Za-z]+)*)\s+([A-Z]{2})\s+\d{5}')
+
+# Header/footer rows are recognised by any of these keywords, matched in one pass
+SKIP_KEYWORDS = [
+    'PATIENT NAME', 'ACCOUNT NO', 'SHADE', 'INVOICE DATE',
+    'INVOICE NO', 'QUANTITY', 'MOULD', 'AMOUNT', 'SERVICE',
+    'DWT', 'TOTAL', 'LATE CHARGE'
+]
+_SKIP_ROW = re.compile('|'.join(map(re.escape, SKIP_KEYWORDS)))
+
+# get_text("dict") flags without TEXT_PRESERVE_IMAGES: image blocks are skipped
+# below anyway, so there is no point having PyMuPDF decode and copy their bytes
+_TEXT_DICT_FLAGS = fitz.TEXTFLAGS_DICT & ~fitz.TEXT_PRESERVE_IMAGES
+
+# Row token kinds: a bare integer, a decimal (quantity) or a two-decimal price.
+# Ordered so that ``kind >= _DECIMAL`` means "any decimal number".
+_NOT_NUMBER, _INTEGER, _DECIMAL, _PRICE = range(4)
+
+
+def _classify_token(token: str) -> int:
+    """Return the numeric kind of a row token as one of the int codes above.
+
+    Uses str.isdecimal, which accepts exactly the characters ``\\d`` does,
+    so no regex is needed for these shape checks.
+    """
+    whole, dot, fraction = token.partition('.')
+    if not whole.isdecimal():
+        return _NOT_NUMBER
+    if not dot:
+        return _INTEGER
+    if not fraction.isdecimal():
+        return _NOT_NUMBER
+    return _PRICE if len(fraction) == 2 else _DECIMAL
+
+
+@content_cached
 def parse_invoice(pdf_path: str) -> Dict[str, Any]:
     """
     Parse an Artisan Dental invoice PDF and return a dictionary containing
@@ -13,69 +57,78 @@ def parse_invoice(pdf_path: str) -> Dict[str, Any]:
     # Open the PDF using PyMuPDF
     doc = fitz.open(pdf_path)
 
-    # Collect all text spans along with their x/y coordinates
-    spans: List[Dict[str, Any]] = []
+    # Collect all text spans as parallel lists (text, x, row key) indexed by
+    # span number. The invoice total and office location only look at one
+    # span at a time, so they are picked up during this same pass.
+    span_texts: List[str] = []
+    span_xs: List[float] = []
+    span_rows: List[int] = []
+    total = ''
+    office_location = None
     for page in doc:
-        page_dict = page.get_text("dict")
+        page_dict = page.get_text("dict", flags=_TEXT_DICT_FLAGS)
         for block in page_dict.get("blocks", []):
             if block.get("type") != 0:
                 continue
             for line in block.get("lines", []):
                 for span in line.get("spans", []):
-                    text = span.get("text", "").strip()
+                    # Intern span text: units, "$" and repeated amounts recur on
+                    # every row, so rows then share one string object per value
+                    text = sys.intern(span.get("text", "").strip())
                     if text:
-                        spans.append({
-                            "text": text,
-                            "x": span["bbox"][0],
-                            "y": span["bbox"][1]
-                        })
-
-    # Group spans by their y-coordinate using a small tolerance to form rows
-    rows: Dict[int, List[Dict[str, Any]]] = collections.defaultdict(list)
-    for sp in spans:
-        # Round y to the nearest multiple of 3 to group text on the same horizontal line
-        key = round(sp['y'] / 3) * 3
-        rows[key].append(sp)
+                        span_texts.append(text)
+                        span_xs.append(span["bbox"][0])
+                        # Round y to the nearest multiple of 3 to group text on the same horizontal line
+                        span_rows.append(round(span["bbox"][1] / 3) * 3)
+
+                        # The invoice total is the last decimal number in the document
+                        amount = None
+                        for amount in _AMOUNT.finditer(text):
+                            pass
+                        if amount:
+                            total = amount.group(0)
+
+                        # Office location: first city (without comma) followed by state and ZIP code.
+                        # Lines with commas are vendor addresses like "Portland, OR"
+                        if office_location is None and ',' not in text:
+                            match = _CITY_STATE_ZIP.match(text)
+                            if match:
+                                # In the sample output only the first word (e.g., "Salem") is desired
+                                office_location = match.group(1).split()[0]
+
+    # Group spans by their rounded y-coordinate to form rows. A single sort of
+    # the span indices by (row, x) orders rows top-to-bottom and each row
+    # left-to-right, so groupby can emit the rows directly.
+    order = sorted(range(len(span_texts)), key=lambda i: (span_rows[i], span_xs[i]))
 
     line_items: List[Dict[str, str]] = []
 
     # Iterate over each row to extract line item information
-    for key in sorted(rows.keys()):
-        row = rows[key]
-        # Sort items in the row left-to-right
-        row_sorted = sorted(row, key=lambda x: x['x'])
-        texts = [sp['text'] for sp in row_sorted]
+    for _, row_indices in itertools.groupby(order, key=span_rows.__getitem__):
+        texts = [span_texts[i] for i in row_indices]
         row_upper = ' '.join(texts).upper()
 
         # Skip rows that are headers or footers
-        skip_keywords = [
-            'PATIENT NAME', 'ACCOUNT NO', 'SHADE', 'INVOICE DATE',
-            'INVOICE NO', 'QUANTITY', 'MOULD', 'AMOUNT', 'SERVICE',
-            'DWT', 'TOTAL', 'LATE CHARGE'
-        ]
-        if any(keyword in row_upper for keyword in skip_keywords):
+        if _SKIP_ROW.search(row_upper):
             continue
 
-        # Consider only rows with at least one decimal number (potential quantity/price)
-        if len(texts) >= 3 and any(re.match(r'^\d+\.\d+$', t) for t in texts):
-            # Identify the quantity: the first token with a decimal value
-            quantity = None
+        # Consider only rows long enough to hold a quantity, product and price
+        if len(texts) >= 3:
+            # Classify every token in a single walk: the quantity is the first
+            # decimal token, prices are the two-decimal tokens after it
+            kinds = [_classify_token(token) for token in texts]
             quantity_index = None
-            for i, token in enumerate(texts):
-                if re.match(r'^\d+\.\d+$', token):
-                    quantity = token
-                    quantity_index = i
-                    break
-            if quantity is None:
-                continue
-
-            # Find all price tokens (decimal numbers) after the quantity
-            price_candidates = [
-                (i, token) for i, token in enumerate(texts)
-                if i > quantity_index and re.match(r'^\d+\.\d{2}$', token)
-            ]
-            if not price_candidates:
+            price_indices: List[int] = []
+            for i, kind in enumerate(kinds):
+                if quantity_index is None:
+                    if kind >= _DECIMAL:
+                        quantity_index = i
+                elif kind == _PRICE:
+                    price_indices.append(i)
+            if quantity_index is None or not price_indices:
                 continue
+            quantity = texts[quantity_index]
+            price_candidates = [(i, texts[i]) for i in price_indices[-2:]]
 
             # The last price candidate is treated as the line item total
             last_price_index, line_item_total = price_candidates[-1]
@@ -89,7 +142,7 @@ def parse_invoice(pdf_path: str) -> Dict[str, Any]:
             product_name_tokens: List[str] = []
             for i in range(quantity_index + 1, last_price_index):
                 token = texts[i]
-                if product_number is None and re.match(r'^\d+$', token):
+                if product_number is None and kinds[i] == _INTEGER:
                     product_number = token
                 else:
                     product_name_tokens.append(token)
@@ -105,31 +158,21 @@ def parse_invoice(pdf_path: str) -> Dict[str, Any]:
                     'line_item_total': line_item_total
                 })
 
-    # Concatenate all text for global searches
-    all_text = '\n'.join(sp['text'] for sp in spans)
-
-    # Extract the invoice date (format: MM/DD/YYYY)
-    invoice_date_match = re.search(r'\b\d{2}/\d{2}/\d{4}\b', all_text)
-    invoice_date = invoice_date_match.group(0) if invoice_date_match else ''
-
-    # Extract invoice number (format: IN followed by digits)
-    invoice_number_match = re.search(r'\bIN\d+\b', all_text)
-    invoice_number = invoice_number_match.group(0) if invoice_number_match else ''
-
-    # Extract the invoice total as the last decimal number in the document
-    decimal_numbers = re.findall(r'\d+\.\d{2}', all_text)
-    total = decimal_numbers[-1] if decimal_numbers else ''
-
-    # Determine office location: first city (without comma) followed by state and ZIP code
-    office_location = None
-    for line in all_text.split('\n'):
-        match = re.match(r'([A-Za-z]+(?:\s+[A-Za-z]+)*)\s+([A-Z]{2})\s+\d{5}', line)
-        # Choose lines that do not include commas to avoid vendor addresses like "Portland, OR"
-        if match and ',' not in line:
-            city = match.group(1)
-            # In the sample output only the first word (e.g., "Salem") is desired
-            office_location = city.split()[0]
-            break
+    # Concatenate all text for the header field searches
+    all_text = '\n'.join(span_texts)
+
+    # Extract the first invoice date and invoice number in a single pass,
+    # stopping as soon as both have been seen
+    header_fields = {'invoice_date': '', 'invoice_number': ''}
+    missing = len(header_fields)
+    for match in _HEADER_FIELDS.finditer(all_text):
+        if not header_fields[match.lastgroup]:
+            header_fields[match.lastgroup] = match.group(0)
+            missing -= 1
+            if not missing:
+                break
+    invoice_date = header_fields['invoice_date']
+    invoice_number = header_fields['invoice_number']
 
     # Due date rule for Artisan: always 30 days from invoice date (no parsing)
     from datetime import datetime, timedelta
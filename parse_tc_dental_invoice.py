@@ -5,26 +5,67 @@ import json
 import os
 import argparse
 
-
+from invoice_parse_cache import content_cached
+from pdf_text_cache import get_layout_text
+
+# Patterns used by parse_tc_dental_invoice, compiled once at import
+_MULTI_SPACE = re.compile(r' {2,}')
+_INVOICE_NUMBER = re.compile(r'Invoice Number:.*?([A-Za-z0-9]+-[A-Za-z0-9]+)', re.DOTALL)
+_INVOICE_DATE = re.compile(r'Invoice Date:.*?([0-9]{1,2}/[0-9]{1,2}/[0-9]{4})', re.DOTALL)
+_SUB_TOTAL = re.compile(r'SUB TOTAL.*?\$\s*([0-9,.]+)', re.IGNORECASE)
+_ITEMS_END = re.compile(r'(SUB TOTAL|Note|CUSTOMER SATISFACTION)', re.IGNORECASE)
+_LINE_ITEM = re.compile(r'(.*?)\$\s*([0-9,.]+)\s+([0-9,.]+)\s+\$\s*([0-9,.]+)')
+_DUE_DATE_LABEL = re.compile(r'Due Date\s*:\s*([0-9]{1,2}/[0-9]{1,2}/[0-9]{4})', re.IGNORECASE)
+_DUE_DATE_NEXT_LINE = re.compile(r'\bDue Date\b\s*\n\s*([0-9]{1,2}/[0-9]{1,2}/[0-9]{4})', re.IGNORECASE)
+_DUE_DATE_HEADER = re.compile(r'Invoice Date\s*:\s*[0-9/]+[\s\S]{0,200}?Due Date\s*:?\s*([0-9/]{8,10})', re.IGNORECASE)
+
+_AMOUNT_CHARS = frozenset('0123456789,.')
+
+
+def _is_amount(token: str) -> bool:
+    return bool(token) and _AMOUNT_CHARS.issuperset(token)
+
+
+def _split_line_item(row: str):
+    """Split a 'description $ price qty $ total' row into its four fields.
+
+    Rows are normally plain enough to cut on the two '$' signs; anything
+    else (extra '$', trailing text after the total) goes through _LINE_ITEM.
+    """
+    parts = row.split('$')
+    if len(parts) == 3 and parts[1][-1:].isspace():
+        price_qty = parts[1].split()
+        line_total = parts[2].strip()
+        if len(price_qty) == 2 and _is_amount(price_qty[0]) and _is_amount(price_qty[1]) and _is_amount(line_total):
+            return parts[0].strip(), price_qty[0], price_qty[1], line_total
+    line_match = _LINE_ITEM.match(row)
+    if line_match:
+        return line_match.group(1).strip(), line_match.group(2), line_match.group(3), line_match.group(4)
+    return None
+
+
+@content_cached
 def parse_tc_dental_invoice(pdf_path: str) -> dict:
     pdf_path = os.path.expanduser(pdf_path)  # Expand ~
     try:
-        completed = subprocess.run(
-            ['pdftotext', '-layout', '-nopgbrk', pdf_path, '-'],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            check=True
-        )
-        text = completed.stdout.decode('utf-8', errors='ignore')
+        text = get_layout_text(pdf_path, '-nopgbrk')
     except subprocess.CalledProcessError as e:
         raise RuntimeError(f"Failed to convert PDF: {e.stderr.decode()}")
+    return parse_tc_dental_text(text)
+
+
+def parse_tc_dental_text(text: str) -> dict:
+    """Parse TC Dental fields from ``pdftotext -layout -nopgbrk`` output.
 
+    Lets a caller that already holds the extracted text (e.g. one shared by
+    several vendor parsers) skip a second PDF conversion.
+    """
     lines = text.split('\n')
-    normalized_text = re.sub(r' {2,}', ' ', text.replace('\t', ' '))
+    normalized_text = _MULTI_SPACE.sub(' ', text.replace('\t', ' '))
 
-    invoice_number_match = re.search(r'Invoice Number:.*?([A-Za-z0-9]+-[A-Za-z0-9]+)', text, re.DOTALL)
-    invoice_date_match = re.search(r'Invoice Date:.*?([0-9]{1,2}/[0-9]{1,2}/[0-9]{4})', text, re.DOTALL)
-    total_match = re.search(r'SUB TOTAL.*?\$\s*([0-9,.]+)', text, re.IGNORECASE)
+    invoice_number_match = _INVOICE_NUMBER.search(text)
+    invoice_date_match = _INVOICE_DATE.search(text)
+    total_match = _SUB_TOTAL.search(text)
 
     invoice_number = invoice_number_match.group(1) if invoice_number_match else ''
     invoice_date = invoice_date_match.group(1) if invoice_date_match else ''
@@ -43,16 +84,13 @@ def parse_tc_dental_invoice(pdf_path: str) -> dict:
 
     if start_idx is not None:
         for row in lines[start_idx + 1:]:
-            if re.search(r'(SUB TOTAL|Note|CUSTOMER SATISFACTION)', row, re.IGNORECASE):
+            if _ITEMS_END.search(row):
                 break
             if not row.strip():
                 continue
-            line_match = re.match(r'(.*?)\$\s*([0-9,.]+)\s+([0-9,.]+)\s+\$\s*([0-9,.]+)', row)
-            if line_match:
-                description = line_match.group(1).strip()
-                unit_price = line_match.group(2)
-                quantity = line_match.group(3)
-                line_total = line_match.group(4)
+            fields = _split_line_item(row)
+            if fields:
+                description, unit_price, quantity, line_total = fields
                 line_items.append({
                     "product_number": "N/A",
                     "product_name": description,
@@ -64,13 +102,13 @@ def parse_tc_dental_invoice(pdf_path: str) -> dict:
     # TC Dental: parse exact due date; no fallback logic (must be perfect)
     due_date = ""
     # Look for explicit "Due Date:" label or standalone pattern near header
-    m = re.search(r'Due Date\s*:\s*([0-9]{1,2}/[0-9]{1,2}/[0-9]{4})', text, re.IGNORECASE)
+    m = _DUE_DATE_LABEL.search(text)
     if not m:
         # Some layouts may have it on a separate line following the header
-        m = re.search(r'\bDue Date\b\s*\n\s*([0-9]{1,2}/[0-9]{1,2}/[0-9]{4})', text, re.IGNORECASE)
+        m = _DUE_DATE_NEXT_LINE.search(text)
     if not m:
         # Fallback: search lines close to "Invoice Date:" section
-        header_block = re.search(r'Invoice Date\s*:\s*[0-9/]+[\s\S]{0,200}?Due Date\s*:?\s*([0-9/]{8,10})', text, re.IGNORECASE)
+        header_block = _DUE_DATE_HEADER.search(text)
         if header_block:
             m = header_block
     if m:
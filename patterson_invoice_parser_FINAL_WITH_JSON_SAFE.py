@@ -62,6 +62,36 @@ import subprocess
 import re
 from typing import List, Dict, Any, Optional
 
+from invoice_parse_cache import content_cached
+from pdf_text_cache import get_layout_text
+
+# Patterns used by the ``_extract_*`` helpers, compiled once at import.
+_INVOICE_NUMBER = re.compile(r"Invoice\s+(\d+)")
+_INVOICE_DATE = re.compile(r"Date:\s*(\d{4}-\d{2}-\d{2})")
+_TOTAL = re.compile(r"Total\s+\$?\s*([\d,.]+)")
+_CITY_STATE_ZIP = re.compile(r"\b([A-Z]+)\s+[A-Z]{2}\s+\d{5}\b")
+_PC_SMILES_CITY = re.compile(r"PC\s+SMILES\s+([A-Z]+)")
+# Quantifiers written possessively (``++``) are followed by a character class
+# they cannot overlap with, so giving characters back could never produce a
+# match; making them possessive stops the engine from retrying those splits
+# on rows that do not end in a price.  The description and the separator in
+# front of it keep backtracking, which a blank description relies on.  The
+# product number and description share a line; the columns after them may
+# wrap onto the next one.
+_LINE_ITEM = re.compile(
+    r"(\d{8})"            # product number (8 digits)
+    r"[^\S\n]+"           # whitespace separator on the same line
+    r"([A-Z0-9 /()\-.,]+?)"  # description (non-greedy, no line breaks)
+    r"\s++"               # whitespace separator
+    r"(\d++\.\d++)"     # quantity with decimal
+    r"\s++"               # whitespace separator
+    r"([A-Z]{2})"          # unit (two uppercase letters)
+    r"\s++\$"            # whitespace, dollar sign prefix
+    r"([\d,.]++)"         # unit price or amount
+    r"\s++"               # whitespace separator
+    r"([\d,.]++)"         # unit price or amount
+)
+
 
 def _run_pdftotext(pdf_path: str) -> str:
     """Run pdftotext with layout preservation and return the resulting text.
@@ -77,14 +107,12 @@ def _run_pdftotext(pdf_path: str) -> str:
     """
     try:
         # ``-layout`` preserves column alignment which aids regex parsing.
-        text_bytes = subprocess.check_output(
-            ["pdftotext", "-layout", pdf_path, "-"], stderr=subprocess.STDOUT
-        )
+        # The text is shared with other parsers through ``pdf_text_cache``.
+        return get_layout_text(pdf_path)
     except subprocess.CalledProcessError as exc:
         raise RuntimeError(
-            f"pdftotext failed with exit code {exc.returncode}: {exc.output.decode(errors='ignore')}"
+            f"pdftotext failed with exit code {exc.returncode}: {exc.stderr.decode(errors='ignore')}"
         ) from exc
-    return text_bytes.decode("utf-8", errors="ignore")
 
 
 def _extract_invoice_number(text: str) -> Optional[str]:
@@ -100,7 +128,7 @@ def _extract_invoice_number(text: str) -> Optional[str]:
     Returns:
         The invoice number as a string, or ``None`` if not found.
     """
-    match = re.search(r"Invoice\s+(\d+)", text)
+    match = _INVOICE_NUMBER.search(text)
     return match.group(1) if match else None
 
 
@@ -116,15 +144,18 @@ def _extract_invoice_date(text: str) -> Optional[str]:
     Returns:
         The invoice date as ``YYYY-MM-DD``, or ``None`` if not found.
     """
-    match = re.search(r"Date:\s*(\d{4}-\d{2}-\d{2})", text)
+    match = _INVOICE_DATE.search(text)
     return match.group(1) if match else None
 
 
 def _extract_total(text: str) -> Optional[str]:
     """Extract the final invoice total amount from the text."""
-    matches = re.findall(r"Total\s+\$?\s*([\d,.]+)", text)
-    if matches:
-        return matches[-1].replace(",", "")
+    # Walk the matches keeping only the last one instead of building a list
+    match = None
+    for match in _TOTAL.finditer(text):
+        pass
+    if match:
+        return match.group(1).replace(",", "")
     return None
 def _extract_office_location(text: str) -> Optional[str]:
     """Derive the office location (city) from the invoice text.
@@ -144,11 +175,11 @@ def _extract_office_location(text: str) -> Optional[str]:
         found.
     """
     # First, try to find a line with CITY STATE ZIP (e.g. RIDDLE OR 97469)
-    match = re.search(r"\b([A-Z]+)\s+[A-Z]{2}\s+\d{5}\b", text)
+    match = _CITY_STATE_ZIP.search(text)
     if match:
         return match.group(1).title()
     # Fall back to capturing the city after "PC SMILES"
-    match = re.search(r"PC\s+SMILES\s+([A-Z]+)", text)
+    match = _PC_SMILES_CITY.search(text)
     if match:
         return match.group(1).title()
     return None
@@ -174,6 +205,10 @@ def _extract_line_items(text: str) -> List[Dict[str, str]]:
     * ``\$([\\d,.]+)`` captures the unit price without the dollar sign.
     * ``([\\d,.]+)`` captures the line item total.
 
+    The product number and description must share a line, but the
+    quantity, unit, price and total may wrap onto the following line, as
+    they do when a long row overflows in ``pdftotext`` output.
+
     Args:
         text: The invoice text.
 
@@ -182,21 +217,8 @@ def _extract_line_items(text: str) -> List[Dict[str, str]]:
         ``product_number``, ``product_name``, ``Quantity``,
         ``unit_price`` and ``line_item_total``.
     """
-    pattern = re.compile(
-        r"(\d{8})"            # product number (8 digits)
-        r"\s+"                # whitespace separator
-        r"([A-Z0-9 /()\-.,]+?)"  # description (non-greedy)
-        r"\s+"                # whitespace separator
-        r"(\d+\.\d+)"       # quantity with decimal
-        r"\s+"                # whitespace separator
-        r"([A-Z]{2})"          # unit (two uppercase letters)
-        r"\s+\$"             # whitespace, dollar sign prefix
-        r"([\d,.]+)"          # unit price or amount
-        r"\s+"                # whitespace separator
-        r"([\d,.]+)"          # unit price or amount
-    )
     items: List[Dict[str, str]] = []
-    for m in pattern.finditer(text):
+    for m in _LINE_ITEM.finditer(text):
         product_number = m.group(1)
         description = m.group(2).strip()
         quantity = m.group(3)
@@ -214,6 +236,7 @@ def _extract_line_items(text: str) -> List[Dict[str, str]]:
     return items
 
 
+@content_cached
 def parse_patterson_invoice(pdf_path: str) -> Dict[str, Any]:
     """Parse a Patterson Dental invoice PDF into structured data.
 
@@ -229,8 +252,25 @@ def parse_patterson_invoice(pdf_path: str) -> Dict[str, Any]:
         RuntimeError: If text extraction fails or required fields are
             not found.
     """
-    text = _run_pdftotext(pdf_path)
+    return parse_patterson_text(_run_pdftotext(pdf_path))
+
+
+def parse_patterson_text(text: str) -> Dict[str, Any]:
+    """Parse Patterson Dental fields from ``pdftotext -layout`` output.
+
+    This is the analysis half of :func:`parse_patterson_invoice`, for
+    callers that already hold the extracted text and want to avoid a
+    second PDF conversion.
 
+    Args:
+        text: Layout-preserved text of the invoice.
+
+    Returns:
+        The same dictionary as :func:`parse_patterson_invoice`.
+
+    Raises:
+        RuntimeError: If required fields are not found.
+    """
     invoice_number = _extract_invoice_number(text)
     invoice_date = _extract_invoice_date(text)
     total = _extract_total(text)
@@ -0,0 +1,84 @@
+"""Shared, memoised ``pdftotext -layout`` extraction for the PDF parsers.
+
+The TC Dental and Patterson parsers both convert the PDF with Poppler's
+``pdftotext`` before running their regular expressions.  When a pipeline
+tries more than one parser on the same invoice, each attempt used to fork
+its own ``pdftotext`` process.  ``get_layout_text`` runs the conversion once
+per file version and hands later callers the cached text.
+
+Entries are keyed on the absolute path together with the file's
+``st_mtime_ns`` and ``st_size``, so a PDF that is rewritten in place is
+converted again rather than served stale.
+
+When the ``pdftotext`` Python bindings (Poppler's C++ API) are installed the
+conversion runs in-process; otherwise the ``pdftotext`` CLI is used.
+"""
+
+import os
+import shutil
+import subprocess
+from functools import lru_cache
+from typing import Tuple
+
+try:
+    import pdftotext
+except ImportError:
+    pdftotext = None
+
+# Absolute path so subprocess can start the CLI with posix_spawn rather than
+# fork+exec (it only does so for a path with a directory and close_fds=False)
+PDFTOTEXT_CLI = shutil.which('pdftotext') or 'pdftotext'
+
+
+def get_layout_text(pdf_path: str, *extra_args: str) -> str:
+    """Return the ``pdftotext -layout`` text of ``pdf_path``.
+
+    Args:
+        pdf_path: Path to the PDF file to convert.
+        *extra_args: Additional ``pdftotext`` flags (e.g. ``-nopgbrk``).
+            They are part of the cache key.
+
+    Returns:
+        The decoded text of the PDF.
+
+    Raises:
+        subprocess.CalledProcessError: If ``pdftotext`` fails.
+    """
+    path = os.path.abspath(pdf_path)
+    try:
+        st = os.stat(path)
+    except OSError:
+        # Let pdftotext report the missing/unreadable file as it always has
+        return _run_pdftotext(path, extra_args)
+    return _cached_layout_text(path, st.st_mtime_ns, st.st_size, extra_args)
+
+
+@lru_cache(maxsize=128)
+def _cached_layout_text(path: str, mtime_ns: int, size: int, extra_args: Tuple[str, ...]) -> str:
+    if pdftotext is not None and set(extra_args) <= {'-nopgbrk'}:
+        try:
+            return _read_with_bindings(path, page_breaks='-nopgbrk' not in extra_args)
+        except pdftotext.Error:
+            # Let the CLI produce the usual CalledProcessError for bad PDFs
+            pass
+    return _run_pdftotext(path, extra_args)
+
+
+def _read_with_bindings(path: str, page_breaks: bool) -> str:
+    """In-process equivalent of ``pdftotext -layout [-nopgbrk] path -``."""
+    with open(path, 'rb') as f:
+        pdf = pdftotext.PDF(f, physical=True)
+    # The CLI ends every page with a form feed unless -nopgbrk is given
+    separator = '\f' if page_breaks else ''
+    return ''.join(page + separator for page in pdf)
+
+
+def _run_pdftotext(path: str, extra_args: Tuple[str, ...]) -> str:
+    completed = subprocess.run(
+        [PDFTOTEXT_CLI, '-layout', *extra_args, path, '-'],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        close_fds=False,
+        check=True
+    )
+    return completed.stdout.decode('utf-8', errors='ignore')
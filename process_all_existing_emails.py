@@ -10,12 +10,17 @@ import sys
 import imaplib
 import email
 import time
+import queue
+import threading
+import multiprocessing
+from email import policy
 from email.header import decode_header
 from email.mime.multipart import MIMEMultipart
 from email.mime.base import MIMEBase
 from email.mime.text import MIMEText
-import subprocess
 import json
+import logging
+import vendor_router
 from datetime import datetime
 import re
 
@@ -25,11 +30,37 @@ EMAIL_PASS = "Inv!PCSAI"
 IMAP_SERVER = "imap.secureserver.net"
 IMAP_PORT = 993
 SAVE_DIR = "email_invoices"
+FETCH_BATCH_SIZE = 50  # messages per IMAP FETCH round trip
+FETCH_BATCH_DELAY = 0  # seconds to pause between batches if the server throttles (e.g. 0.2)
+FETCH_QUEUE_SIZE = 16  # fetched messages buffered ahead of attachment handling
+BODY_SCAN_BYTES = 4096  # only the head of the email body is searched for vendor names
 
-def log(msg):
-    """Custom logging function"""
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    print(f"[{timestamp}] {msg}")
+# Characters not allowed in saved attachment filenames
+_FILENAME_SANITIZE_RE = re.compile(r'[^\w\-_\.]')
+
+# UID item in a FETCH response line
+_FETCH_UID_RE = re.compile(rb'UID (\d+)')
+
+# Vendor keywords scanned in one pass over the lowercased email text, in
+# priority order. "tc" is fenced with word boundaries so it no longer fires
+# inside words like "match" or "etc"; the lab's own domain
+# (info@tcdentallab.com) runs it into "dental", so that is matched whole.
+VENDOR_KEYWORD_PRIORITY = ('epic', 'patterson', 'henry', 'artisan', 'tc')
+_VENDOR_KEYWORD_RE = re.compile(
+    r'(?P<epic>epic)|(?P<patterson>patterson)|(?P<henry>henry)|(?P<artisan>artisan)'
+    r'|(?P<tc>\btc\b|\bt\.c\.|tcdental)'
+)
+
+# Console logging; the timestamp is only formatted for records actually emitted
+logger = logging.getLogger("process_all_emails")
+logger.setLevel(logging.INFO)
+logger.propagate = False
+if not logger.handlers:
+    _handler = logging.StreamHandler(sys.stdout)
+    _handler.setFormatter(logging.Formatter("[%(asctime)s] %(message)s", datefmt="%Y-%m-%d %H:%M:%S"))
+    logger.addHandler(_handler)
+
+log = logger.info
 
 def create_directories():
     """Create necessary directories if they don't exist"""
@@ -37,127 +68,84 @@ def create_directories():
     os.makedirs("output_jsons", exist_ok=True)
     os.makedirs("processed_invoices", exist_ok=True)
 
+def _match_vendor_keyword(text):
+    """Return the highest-priority vendor keyword in lowercased text, or None"""
+    found = set()
+    for match in _VENDOR_KEYWORD_RE.finditer(text):
+        if match.lastgroup == VENDOR_KEYWORD_PRIORITY[0]:
+            return match.lastgroup
+        found.add(match.lastgroup)
+    for vendor in VENDOR_KEYWORD_PRIORITY:
+        if vendor in found:
+            return vendor
+    return None
+
 def detect_vendor_from_email(msg):
     """Detect vendor from email content"""
     try:
-        # Get email subject
+        # Cheapest field first: the sender address usually names the vendor
+        sender = msg.get('from', '')
+        vendor = _match_vendor_keyword(str(sender).lower())
+        if vendor:
+            return vendor
+        
+        # Then the subject
         subject = ""
         if msg['subject']:
             subject = decode_header(msg['subject'])[0][0]
             if isinstance(subject, bytes):
                 subject = subject.decode('utf-8', errors='ignore')
+        vendor = _match_vendor_keyword(subject.lower())
+        if vendor:
+            return vendor
         
-        # Get email body
-        body = ""
-        if msg.is_multipart():
-            for part in msg.walk():
-                if part.get_content_type() == "text/plain":
-                    body = part.get_payload(decode=True).decode('utf-8', errors='ignore')
-                    break
-        else:
-            body = msg.get_payload(decode=True).decode('utf-8', errors='ignore')
-        
-        # Get sender
-        sender = msg.get('from', '')
-        
-        # Combine all text for vendor detection
-        all_text = f"{subject} {body} {sender}".lower()
+        # Otherwise look at the start of the body, where the vendor's letterhead
+        # and signature boilerplate sit; long bodies are not decoded in full
+        # get_body picks the text/plain part without visiting the attachments
+        body_part = msg.get_body(preferencelist=('plain',))
+        payload = body_part.get_payload(decode=True) if body_part is not None else None
         
-        # Vendor detection logic
-        if 'epic' in all_text:
-            return 'epic'
-        elif 'patterson' in all_text:
-            return 'patterson'
-        elif 'henry' in all_text:
-            return 'henry'
-        elif 'artisan' in all_text:
-            return 'artisan'
-        elif 'tc' in all_text or 't.c.' in all_text:
-            return 'tc'
-        else:
+        if not payload:
             return None
+        body = payload[:BODY_SCAN_BYTES].decode('utf-8', errors='ignore')
+        return _match_vendor_keyword(body.lower())
             
     except Exception as e:
         log(f"❌ Error detecting vendor from email: {e}")
         return None
 
 def run_vendor_router(filepath, detected_vendor=None):
-    """Run the vendor router to process the PDF and generate JSON output"""
+    """Detect the vendor and parse the PDF in-process, writing its JSON output"""
     try:
-        # First, run vendor router to detect vendor
-        cmd = ['python3', 'vendor_router.py', filepath]
-        if detected_vendor:
-            cmd.append(detected_vendor)
+        log(f"🔄 Running vendor router: {filepath}" + (f" ({detected_vendor})" if detected_vendor else ""))
+        vendor, result = vendor_router.detect_and_parse(filepath, detected_vendor)
         
-        log(f"🔄 Running vendor router: {' '.join(cmd)}")
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
+        if not vendor:
+            log(f"❓ Unknown vendor, skipping parsing")
+            return False
         
-        if result.returncode == 0:
-            vendor = result.stdout.strip()
-            log(f"✅ Vendor detected: {vendor}")
-            
-            # Now run the actual parser to generate JSON
-            if vendor and vendor != "unknown":
-                parser_file = get_parser_file(vendor)
-                if parser_file:
-                    log(f"🔧 Running {vendor} parser: {parser_file}")
-                    parser_result = subprocess.run(
-                        ['python3', parser_file, filepath],
-                        capture_output=True,
-                        text=True,
-                        timeout=120
-                    )
-                    
-                    if parser_result.returncode == 0:
-                        log(f"✅ {vendor} parser completed successfully")
-                        if "Extracted" in parser_result.stdout:
-                            log(f"📊 JSON generated for {vendor} invoice")
-                        else:
-                            log(f"⚠️ Parser ran but may not have extracted data")
-                        return True
-                    else:
-                        log(f"❌ {vendor} parser failed: {parser_result.stderr}")
-                        return False
-                else:
-                    log(f"❌ No parser found for vendor: {vendor}")
-                    return False
-            else:
-                log(f"❓ Unknown vendor, skipping parsing")
-                return False
+        log(f"✅ Vendor detected: {vendor}")
+        log(f"✅ {vendor} parser completed successfully")
+        if result.get("line_items"):
+            log(f"📊 JSON generated for {vendor} invoice")
         else:
-            log(f"❌ Vendor router failed: {result.stderr}")
-            return False
+            log(f"⚠️ Parser ran but may not have extracted data")
+        return True
         
-    except subprocess.TimeoutExpired:
-        log(f"⏰ Vendor router timed out")
-        return False
     except Exception as e:
         log(f"❌ Error running vendor router: {e}")
         return False
 
-def get_parser_file(vendor):
-    """Get the parser file for a given vendor"""
-    parser_mapping = {
-        'epic': 'epic_parser.py',
-        'patterson': 'patterson_invoice_parser_FINAL_WITH_JSON_SAFE.py',
-        'henry': 'henry_parser.py',
-        'exodus': 'exodus_parser.py',
-        'artisan': 'parse_artisan_dental_exporting_fixed.py',
-        'tc': 'parse_tc_dental_invoice.py'
-    }
-    
-    parser_file = parser_mapping.get(vendor)
-    if parser_file and os.path.exists(parser_file):
-        return parser_file
-    return None
+def process_attachments(msg, email_id, pool):
+    """Save PDF attachments and queue each one for parsing on the worker pool.
 
-def process_attachments(msg, email_id):
-    """Process email attachments"""
+    Returns a list of (filename, AsyncResult) pairs; each result resolves to
+    run_vendor_router's success flag.
+    """
+    jobs = []
     try:
         if not msg.is_multipart():
-            return 0
-        
-        processed_count = 0
+            return jobs
         
         for part in msg.walk():
             if part.get_content_maintype() == 'multipart':
@@ -171,8 +159,13 @@ def process_attachments(msg, email_id):
                 continue
                 
             # Decode filename if needed
-            if decode_header(filename)[0][1] is not None:
-                filename = decode_header(filename)[0][0].decode(decode_header(filename)[0][1])
+            raw_filename, encoding = decode_header(filename)[0]
+            if encoding is not None and isinstance(raw_filename, bytes):
+                try:
+                    filename = raw_filename.decode(encoding, errors='replace')
+                except LookupError:
+                    # Unknown charset label in the header
+                    filename = raw_filename.decode('utf-8', errors='replace')
             
             # Check if it's a PDF
             if not filename.lower().endswith('.pdf'):
@@ -182,13 +175,15 @@ def process_attachments(msg, email_id):
             
             # Create unique filename
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            safe_filename = re.sub(r'[^\w\-_\.]', '_', filename)
+            safe_filename = _FILENAME_SANITIZE_RE.sub('_', filename)
             unique_filename = f"email_{email_id}_{timestamp}_{safe_filename}"
             filepath = os.path.join(SAVE_DIR, unique_filename)
             
-            # Save the PDF
+            # Save the PDF, then drop the decoded bytes before the parser runs
+            payload = part.get_payload(decode=True)
             with open(filepath, 'wb') as f:
-                f.write(part.get_payload(decode=True))
+                f.write(memoryview(payload))
+            del payload
             
             log(f"💾 Saved PDF to: {filepath}")
             
@@ -199,21 +194,99 @@ def process_attachments(msg, email_id):
             else:
                 log(f"❓ No vendor detected, will auto-detect from PDF")
             
-            # Run vendor router
-            if run_vendor_router(filepath, detected_vendor):
-                processed_count += 1
-                log(f"✅ Successfully processed: {filename}")
-                
-                # Note: Invoice queue writer runs as background service
-                # New JSON files will be automatically detected and added to queue
-            else:
-                log(f"❌ Failed to process: {filename}")
+            # Run vendor router in a worker while the next emails are fetched
+            jobs.append((filename, pool.apply_async(run_vendor_router, (filepath, detected_vendor))))
         
-        return processed_count
+        return jobs
         
     except Exception as e:
         log(f"❌ Error processing attachments: {e}")
-        return 0
+        return jobs
+
+def connect_to_mailbox():
+    """Log in to the IMAP server and select the inbox"""
+    mail = imaplib.IMAP4_SSL(IMAP_SERVER, IMAP_PORT)
+    mail.login(EMAIL_USER, EMAIL_PASS)
+    mail.select('INBOX')
+    return mail
+
+def fetch_emails_in_batches(mail, email_ids, batch_size=FETCH_BATCH_SIZE):
+    """Yield (uid, message) pairs, fetching batch_size messages per UID FETCH.
+
+    email_ids are message UIDs, which unlike sequence numbers stay valid across
+    a reconnect. Messages are yielded in the order given. RFC822 is fetched (not
+    BODY.PEEK[]) so messages are still marked as seen, which keeps the live
+    ingestion agent's UNSEEN search from picking them up again.
+
+    If the connection drops mid-run it is re-opened once and the failed batch
+    retried, rather than abandoning the remaining messages.
+    """
+    reconnected = False
+    try:
+        for start in range(0, len(email_ids), batch_size):
+            if start and FETCH_BATCH_DELAY:
+                time.sleep(FETCH_BATCH_DELAY)
+
+            batch = email_ids[start:start + batch_size]
+            message_set = b','.join(batch)
+            try:
+                status, msg_data = mail.uid('fetch', message_set, '(UID RFC822)')
+            except (imaplib.IMAP4.abort, OSError) as e:
+                if reconnected:
+                    raise
+                log(f"⚠️ IMAP connection lost ({e}), reconnecting...")
+                mail = connect_to_mailbox()
+                reconnected = True
+                status, msg_data = mail.uid('fetch', message_set, '(UID RFC822)')
+
+            if status != 'OK':
+                log(f"❌ Failed to fetch emails {batch[0].decode()}..{batch[-1].decode()}")
+                continue
+
+            # Responses are (b'<seq> (UID <uid> RFC822 {size}', raw_bytes) tuples
+            # separated by b')'; a server may instead send the UID after the literal
+            messages = {}
+            pending = None
+            for item in msg_data:
+                if isinstance(item, tuple):
+                    match = _FETCH_UID_RE.search(item[0])
+                    if match:
+                        messages[match.group(1)] = item[1]
+                        pending = None
+                    else:
+                        pending = item[1]
+                elif pending is not None:
+                    match = _FETCH_UID_RE.search(item)
+                    if match:
+                        messages[match.group(1)] = pending
+                    pending = None
+
+            for email_id in batch:
+                raw_email = messages.get(email_id)
+                if raw_email is None:
+                    log(f"❌ Failed to fetch email {email_id}")
+                    continue
+                yield email_id, email.message_from_bytes(raw_email, policy=policy.default)
+    finally:
+        # The replacement connection is ours to close; the caller closes the original
+        if reconnected:
+            try:
+                mail.logout()
+            except (imaplib.IMAP4.error, OSError):
+                pass
+
+def fetch_into_queue(mail, email_ids, fetched):
+    """Producer thread: feed fetched (uid, message) pairs into the bounded queue.
+
+    A final None tells the consumer that fetching has finished.
+    """
+    try:
+        for item in fetch_emails_in_batches(mail, email_ids):
+            fetched.put(item)
+    except Exception as e:
+        log(f"❌ Error fetching emails: {e}")
+    finally:
+        fetched.put(None)
 
 def process_all_emails():
     """Process all existing emails in the inbox"""
@@ -225,16 +298,12 @@ def process_all_emails():
         
         # Connect to IMAP server
         log(f"📧 Connecting to {IMAP_SERVER}...")
-        mail = imaplib.IMAP4_SSL(IMAP_SERVER, IMAP_PORT)
-        mail.login(EMAIL_USER, EMAIL_PASS)
+        mail = connect_to_mailbox()
         log("✅ Connected to email server")
         
-        # Select inbox
-        mail.select('INBOX')
-        
         # Search for all emails
         log("🔍 Searching for all emails...")
-        status, messages = mail.search(None, 'ALL')
+        status, messages = mail.uid('search', None, 'ALL')
         
         if status != 'OK':
             log("❌ Failed to search emails")
@@ -251,45 +320,67 @@ def process_all_emails():
         processed_emails = 0
         processed_pdfs = 0
         
-        # Process emails from newest to oldest
-        for i, email_id in enumerate(reversed(email_ids), 1):
-            try:
-                log(f"📧 Processing email {i}/{total_emails} (ID: {email_id.decode()})")
-                
-                # Fetch email
-                status, msg_data = mail.fetch(email_id, '(RFC822)')
-                if status != 'OK':
-                    log(f"❌ Failed to fetch email {email_id}")
+        # A fetch thread keeps pulling emails (newest to oldest) while worker
+        # processes parse the PDFs already saved from earlier ones
+        fetched = queue.Queue(maxsize=FETCH_QUEUE_SIZE)
+        newest_first = email_ids[::-1]
+        fetcher = threading.Thread(target=fetch_into_queue, args=(mail, newest_first, fetched), daemon=True)
+        
+        parse_jobs = []
+        with multiprocessing.Pool(processes=os.cpu_count()) as pool:
+            # Start fetching only once the workers are forked, so no child
+            # inherits a lock held mid-I/O by the fetch thread (ssl, stdio)
+            fetcher.start()
+            i = 0
+            while True:
+                item = fetched.get()
+                if item is None:
+                    break
+                i += 1
+                email_id, msg = item
+                try:
+                    log(f"📧 Processing email {i}/{total_emails} (UID: {email_id.decode()})")
+                    
+                    # Get email subject for logging
+                    subject = ""
+                    if msg['subject']:
+                        subject = decode_header(msg['subject'])[0][0]
+                        if isinstance(subject, bytes):
+                            subject = subject.decode('utf-8', errors='ignore')
+                    
+                    log(f"📋 Subject: {subject[:100]}...")
+                    
+                    # Save attachments and queue them for parsing
+                    jobs = process_attachments(msg, email_id.decode(), pool)
+                    if jobs:
+                        log(f"📎 Queued {len(jobs)} PDF(s) for parsing")
+                        parse_jobs.extend((email_id, filename, job) for filename, job in jobs)
+                    else:
+                        log(f"ℹ️ No PDFs found in this email")
+                    
+                except Exception as e:
+                    log(f"❌ Error processing email {email_id}: {e}")
                     continue
-                
-                # Parse email
-                raw_email = msg_data[0][1]
-                msg = email.message_from_bytes(raw_email)
-                
-                # Get email subject for logging
-                subject = ""
-                if msg['subject']:
-                    subject = decode_header(msg['subject'])[0][0]
-                    if isinstance(subject, bytes):
-                        subject = subject.decode('utf-8', errors='ignore')
-                
-                log(f"📋 Subject: {subject[:100]}...")
-                
-                # Process attachments
-                pdf_count = process_attachments(msg, email_id.decode())
-                if pdf_count > 0:
-                    processed_emails += 1
-                    processed_pdfs += pdf_count
-                    log(f"✅ Email processed: {pdf_count} PDF(s) found")
+            fetcher.join()
+            
+            # Wait for the parses still in flight
+            emails_with_pdfs = set()
+            for email_id, filename, job in parse_jobs:
+                try:
+                    ok = job.get()
+                except Exception as e:
+                    log(f"❌ Error parsing {filename}: {e}")
+                    ok = False
+                if ok:
+                    processed_pdfs += 1
+                    emails_with_pdfs.add(email_id)
+                    log(f"✅ Successfully processed: {filename}")
+                    
+                    # Note: Invoice queue writer runs as background service
+                    # New JSON files will be automatically detected and added to queue
                 else:
-                    log(f"ℹ️ No PDFs found in this email")
-                
-                # Small delay to avoid overwhelming the server
-                time.sleep(0.5)
-                
-            except Exception as e:
-                log(f"❌ Error processing email {email_id}: {e}")
-                continue
+                    log(f"❌ Failed to process: {filename}")
+            processed_emails = len(emails_with_pdfs)
         
         # Summary
         log("=" * 50)
@@ -300,8 +391,8 @@ def process_all_emails():
         # Count generated JSON files
         json_count = 0
         if os.path.exists("output_jsons"):
-            json_files = [f for f in os.listdir("output_jsons") if f.endswith('.json')]
-            json_count = len(json_files)
+            with os.scandir("output_jsons") as entries:
+                json_count = sum(1 for e in entries if e.name.endswith('.json') and e.is_file())
         
         log(f"📄 JSON files generated: {json_count}")
         log(f"📁 Check 'output_jsons/' for parsed results")
@@ -309,9 +400,12 @@ def process_all_emails():
         log(f"📋 Check 'invoice_queue.json' for queue status")
         log("=" * 50)
         
-        # Close connection
-        mail.close()
-        mail.logout()
+        # Close connection (it may already be gone if a reconnect was needed)
+        try:
+            mail.close()
+            mail.logout()
+        except (imaplib.IMAP4.error, OSError):
+            pass
         log("🔌 Disconnected from email server")
         
     except Exception as e:
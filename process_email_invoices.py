@@ -7,84 +7,56 @@ This is useful when you have PDFs already downloaded but need to parse them and
 
 import os
 import sys
-import subprocess
 import json
-from datetime import datetime
+import logging
+import vendor_router
 import glob
+import multiprocessing
 
-def log(msg):
-    """Custom logging function"""
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    print(f"[{timestamp}] {msg}")
+from invoice_parse_cache import cached_output, pdf_digest, remember_output
 
-def get_parser_file(vendor):
-    """Get the parser file for a given vendor"""
-    parser_mapping = {
-        'epic': 'epic_parser.py',
-        'patterson': 'patterson_invoice_parser_FINAL_WITH_JSON_SAFE.py',
-        'henry': 'henry_parser.py',
-        'exodus': 'exodus_parser.py',
-        'artisan': 'parse_artisan_dental_exporting_fixed.py',
-        'tc': 'parse_tc_dental_invoice.py'
-    }
-    
-    parser_file = parser_mapping.get(vendor)
-    if parser_file and os.path.exists(parser_file):
-        return parser_file
-    return None
+# Console logging; the timestamp is only formatted for records actually emitted
+logger = logging.getLogger("process_email_invoices")
+logger.setLevel(logging.INFO)
+logger.propagate = False
+if not logger.handlers:
+    _handler = logging.StreamHandler(sys.stdout)
+    _handler.setFormatter(logging.Formatter("[%(asctime)s] %(message)s", datefmt="%Y-%m-%d %H:%M:%S"))
+    logger.addHandler(_handler)
+
+log = logger.info
 
-def run_vendor_router(filepath):
-    """Run the vendor router to process the PDF and generate JSON output"""
+def run_vendor_router(filepath, digest=None):
+    """Detect the vendor and parse the PDF in-process, writing its JSON output"""
     try:
-        # First, run vendor router to detect vendor
-        cmd = ['python3', 'vendor_router.py', filepath]
+        log(f"🔄 Running vendor router: {filepath}")
+        vendor, result = vendor_router.detect_and_parse(filepath, digest=digest)
         
-        log(f"🔄 Running vendor router: {' '.join(cmd)}")
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
+        if not vendor:
+            log(f"❓ Unknown vendor, skipping parsing")
+            return False
         
-        if result.returncode == 0:
-            vendor = result.stdout.strip()
-            log(f"✅ Vendor detected: {vendor}")
-            
-            # Now run the actual parser to generate JSON
-            if vendor and vendor != "unknown":
-                parser_file = get_parser_file(vendor)
-                if parser_file:
-                    log(f"🔧 Running {vendor} parser: {parser_file}")
-                    parser_result = subprocess.run(
-                        ['python3', parser_file, filepath],
-                        capture_output=True,
-                        text=True,
-                        timeout=120
-                    )
-                    
-                    if parser_result.returncode == 0:
-                        log(f"✅ {vendor} parser completed successfully")
-                        if "Extracted" in parser_result.stdout:
-                            log(f"📊 JSON generated for {vendor} invoice")
-                        else:
-                            log(f"⚠️ Parser ran but may not have extracted data")
-                        return True
-                    else:
-                        log(f"❌ {vendor} parser failed: {parser_result.stderr}")
-                        return False
-                else:
-                    log(f"❌ No parser found for vendor: {vendor}")
-                    return False
-            else:
-                log(f"❓ Unknown vendor, skipping parsing")
-                return False
+        log(f"✅ Vendor detected: {vendor}")
+        log(f"✅ {vendor} parser completed successfully")
+        if result.get("line_items"):
+            log(f"📊 JSON generated for {vendor} invoice")
         else:
-            log(f"❌ Vendor router failed: {result.stderr}")
-            return False
+            log(f"⚠️ Parser ran but may not have extracted data")
+        return True
         
-    except subprocess.TimeoutExpired:
-        log(f"⏰ Vendor router timed out")
-        return False
     except Exception as e:
         log(f"❌ Error running vendor router: {e}")
         return False
 
+def _process_one(job):
+    """Pool worker: parse one (pdf_path, digest) job and report (pdf_path, success)"""
+    pdf_path, digest = job
+    try:
+        return pdf_path, run_vendor_router(pdf_path, digest)
+    except Exception as e:
+        log(f"❌ Error processing {os.path.basename(pdf_path)}: {e}")
+        return pdf_path, False
+
 def process_email_invoices():
     """Process all PDFs in the email_invoices folder"""
     try:
@@ -106,25 +78,35 @@ def process_email_invoices():
         
         processed_count = 0
         failed_count = 0
+        duplicate_count = 0
         
-        # Process each PDF
-        for i, pdf_file in enumerate(pdf_files, 1):
-            try:
+        # Skip PDFs whose exact bytes were already parsed (forwards, resends),
+        # as long as the JSON written for them is still there. The digest is
+        # handed on to the router, so each PDF is hashed once.
+        pdf_hashes = {}
+        seen_now = set()
+        for pdf_file in pdf_files:
+            pdf_hash = pdf_digest(pdf_file)
+            if pdf_hash is not None and (pdf_hash in seen_now or cached_output(pdf_hash)):
+                duplicate_count += 1
+                log(f"⏭️ Skipping duplicate PDF: {os.path.basename(pdf_file)}")
+                continue
+            seen_now.add(pdf_hash)
+            pdf_hashes[pdf_file] = pdf_hash
+        
+        # Parse PDFs in parallel; workers receive paths only, never documents
+        with multiprocessing.Pool(processes=os.cpu_count()) as pool:
+            results = pool.imap_unordered(_process_one, pdf_hashes.items(), chunksize=4)
+            for i, (pdf_file, ok) in enumerate(results, 1):
                 filename = os.path.basename(pdf_file)
-                log(f"📄 Processing {i}/{len(pdf_files)}: {filename}")
-                
-                # Run vendor router
-                if run_vendor_router(pdf_file):
+                if ok:
                     processed_count += 1
-                    log(f"✅ Successfully processed: {filename}")
+                    json_path = os.path.join(vendor_router.OUTPUT_FOLDER, os.path.splitext(filename)[0] + ".json")
+                    remember_output(pdf_hashes[pdf_file], json_path)
+                    log(f"✅ Successfully processed {i}/{len(pdf_hashes)}: {filename}")
                 else:
                     failed_count += 1
-                    log(f"❌ Failed to process: {filename}")
-                
-            except Exception as e:
-                failed_count += 1
-                log(f"❌ Error processing {filename}: {e}")
-                continue
+                    log(f"❌ Failed to process {i}/{len(pdf_hashes)}: {filename}")
         
         # Summary
         log("=" * 50)
@@ -132,12 +114,13 @@ def process_email_invoices():
         log(f"📄 Total PDFs found: {len(pdf_files)}")
         log(f"✅ Successfully processed: {processed_count}")
         log(f"❌ Failed to process: {failed_count}")
+        log(f"⏭️ Duplicates skipped: {duplicate_count}")
         
         # Count generated JSON files
         json_count = 0
         if os.path.exists("output_jsons"):
-            json_files = [f for f in os.listdir("output_jsons") if f.endswith('.json')]
-            json_count = len(json_files)
+            with os.scandir("output_jsons") as entries:
+                json_count = sum(1 for e in entries if e.name.endswith('.json') and e.is_file())
         
         log(f"📄 Total JSON files: {json_count}")
         log(f"📁 Check 'output_jsons/' for parsed results")
@@ -5,19 +5,31 @@ Reads the current invoice_queue.json and normalizes entries to match PCS AI UI f
 """
 
 import os
-import json
+import orjson
 import glob
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+from invoice_queue_writer import VENDOR_CANONICAL_NAMES, locked_queue, write_queue_if_changed
+
+# Sidecar JSON reads are I/O-bound, so a thread pool overlaps the disk latency
+SIDECAR_READ_WORKERS = 16
+
 def load_json_file(filepath):
     """Load and parse a JSON file"""
     try:
-        with open(filepath, 'r') as f:
-            return json.load(f)
+        with open(filepath, 'rb') as f:
+            return orjson.loads(f.read())
     except Exception as e:
         print(f"❌ Error loading {filepath}: {e}")
         return None
 
+def load_sidecar(json_file):
+    """Load an entry's parsed-invoice JSON; returns (exists, data)"""
+    if not json_file or not os.path.exists(json_file):
+        return False, None
+    return True, load_json_file(json_file)
+
 def normalize_queue_entry(entry, invoice_data):
     """Normalize a queue entry to match PCS AI UI format"""
     
@@ -30,10 +42,7 @@ def normalize_queue_entry(entry, invoice_data):
     office_location = invoice_data.get('office_location', '')
     
     # Normalize vendor name
-    if vendor.lower() == 'henry schein' or vendor.lower() == 'henry schein':
-        vendor = 'Henry Schein'
-    elif vendor.lower() == 'epic dental lab':
-        vendor = 'Epic Dental Lab'
+    vendor = VENDOR_CANONICAL_NAMES.get(vendor.lower(), vendor)
     
     # Create normalized entry
     normalized_entry = {
@@ -61,41 +70,44 @@ def normalize_invoice_queue():
         print("❌ invoice_queue.json not found")
         return
     
-    with open(queue_file, 'r') as f:
-        current_queue = json.load(f)
+    # Hold the queue lock from reading the queue until it is saved
+    with locked_queue(queue_file):
+        with open(queue_file, 'rb') as f:
+            current_queue = orjson.loads(f.read())
     
-    print(f"📋 Found {len(current_queue)} entries in current queue")
+        print(f"📋 Found {len(current_queue)} entries in current queue")
     
-    # Normalize each entry
-    normalized_queue = []
-    processed_count = 0
-    skipped_count = 0
+        # Normalize each entry
+        normalized_queue = []
+        processed_count = 0
+        skipped_count = 0
     
-    for entry in current_queue:
-        json_file = entry.get('json_file')
-        
-        if not json_file or not os.path.exists(json_file):
-            print(f"⚠️ Skipping entry - JSON file not found: {json_file}")
-            skipped_count += 1
-            continue
+        # Load every entry's invoice JSON up front, in parallel
+        json_files = [entry.get('json_file') for entry in current_queue]
+        with ThreadPoolExecutor(max_workers=SIDECAR_READ_WORKERS) as executor:
+            sidecars = list(executor.map(load_sidecar, json_files))
+    
+        for entry, json_file, (exists, invoice_data) in zip(current_queue, json_files, sidecars):
+            if not exists:
+                print(f"⚠️ Skipping entry - JSON file not found: {json_file}")
+                skipped_count += 1
+                continue
         
-        # Load invoice data from JSON file
-        invoice_data = load_json_file(json_file)
-        if not invoice_data:
-            print(f"⚠️ Skipping entry - invalid JSON: {json_file}")
-            skipped_count += 1
-            continue
+            if not invoice_data:
+                print(f"⚠️ Skipping entry - invalid JSON: {json_file}")
+                skipped_count += 1
+                continue
         
-        # Normalize the entry
-        normalized_entry = normalize_queue_entry(entry, invoice_data)
-        normalized_queue.append(normalized_entry)
-        processed_count += 1
+            # Normalize the entry
+            normalized_entry = normalize_queue_entry(entry, invoice_data)
+            normalized_queue.append(normalized_entry)
+            processed_count += 1
         
-        print(f"✅ Normalized: {invoice_data.get('vendor', 'Unknown')} - {invoice_data.get('invoice_number', 'No Number')}")
+            print(f"✅ Normalized: {invoice_data.get('vendor', 'Unknown')} - {invoice_data.get('invoice_number', 'No Number')}")
     
-    # Save normalized queue
-    with open(queue_file, 'w') as f:
-        json.dump(normalized_queue, f, indent=2)
+        # Save normalized queue
+        if not write_queue_if_changed(queue_file, normalized_queue):
+            print("ℹ️ Queue unchanged - invoice_queue.json not rewritten")
     
     print("=" * 50)
     print(f"📊 NORMALIZATION COMPLETE")
@@ -5,9 +5,11 @@ Removes duplicate invoice entries from the queue based on invoice number.
 """
 
 import os
-import json
+import orjson
 from datetime import datetime
 
+from invoice_queue_writer import locked_queue, write_queue_if_changed
+
 def remove_duplicates():
     """Remove duplicate entries from the invoice queue"""
     
@@ -17,39 +19,41 @@ def remove_duplicates():
         print("❌ invoice_queue.json not found")
         return
     
-    with open(queue_file, 'r') as f:
-        current_queue = json.load(f)
+    # Hold the queue lock from reading the queue until it is saved
+    with locked_queue(queue_file):
+        with open(queue_file, 'rb') as f:
+            current_queue = orjson.loads(f.read())
     
-    print(f"📋 Found {len(current_queue)} entries in current queue")
+        print(f"📋 Found {len(current_queue)} entries in current queue")
     
-    # Remove duplicates - keep the first occurrence of each invoice number
-    seen_invoices = set()
-    unique_queue = []
-    removed_count = 0
+        # Remove duplicates - keep the first occurrence of each invoice number
+        seen_invoices = set()
+        unique_queue = []
+        removed_count = 0
     
-    for entry in current_queue:
-        invoice_number = entry.get('invoice_number', '')
+        for entry in current_queue:
+            invoice_number = entry.get('invoice_number', '')
         
-        if not invoice_number:
-            # Skip entries without invoice numbers
-            removed_count += 1
-            print(f"🗑️ Removed: Empty invoice number")
-            continue
+            if not invoice_number:
+                # Skip entries without invoice numbers
+                removed_count += 1
+                print(f"🗑️ Removed: Empty invoice number")
+                continue
         
-        if invoice_number in seen_invoices:
-            # Skip duplicate invoice numbers
-            removed_count += 1
-            print(f"🗑️ Removed duplicate: {invoice_number}")
-            continue
+            if invoice_number in seen_invoices:
+                # Skip duplicate invoice numbers
+                removed_count += 1
+                print(f"🗑️ Removed duplicate: {invoice_number}")
+                continue
         
-        # Add to unique queue
-        seen_invoices.add(invoice_number)
-        unique_queue.append(entry)
-        print(f"✅ Kept: {entry.get('vendor', 'Unknown')} - {invoice_number}")
+            # Add to unique queue
+            seen_invoices.add(invoice_number)
+            unique_queue.append(entry)
+            print(f"✅ Kept: {entry.get('vendor', 'Unknown')} - {invoice_number}")
     
-    # Save deduplicated queue
-    with open(queue_file, 'w') as f:
-        json.dump(unique_queue, f, indent=2)
+        # Save deduplicated queue
+        if not write_queue_if_changed(queue_file, unique_queue):
+            print("ℹ️ Queue unchanged - invoice_queue.json not rewritten")
     
     print("=" * 50)
     print(f"📊 DEDUPLICATION COMPLETE")
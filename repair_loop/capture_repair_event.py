@@ -37,14 +37,27 @@ repair_cases/henry_dental_lab_2025-08-04_001/
 And append a row to ``repair_log.csv`` with details about the repair.
 """
 
+import atexit
 import csv
 import datetime
+import functools
+import json
 import os
 import re
 import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 from pathlib import Path
 
 
+# ``__file__`` points to this script; its parent is ``repair_loop``.
+# Resolved once here rather than on every capture.
+_DEFAULT_ROOT = Path(__file__).resolve().parent
+
+_SLUG_RE = re.compile(r"[^A-Za-z0-9]+")
+
+
 def _slugify(text: str) -> str:
     """Convert arbitrary vendor names into filesystem‑friendly slugs.
 
@@ -59,17 +72,136 @@ def _slugify(text: str) -> str:
         A slug suitable for folder names.
     """
     # Replace non‑alphanumeric characters with underscores
-    slug = re.sub(r"[^A-Za-z0-9]+", "_", text.lower())
+    slug = _SLUG_RE.sub("_", text.lower())
     # Remove leading/trailing underscores
     return slug.strip("_")
 
 
+_COPY_CHUNK = 1 << 20  # 1 MiB per read/write in the user-space fallback
+
+# Page-cache hints are POSIX-only (not available on macOS or Windows)
+_fadvise = getattr(os, "posix_fadvise", None)
+
+
+def _kernel_copy(copy, remaining: int) -> int:
+    """Call ``copy(count)`` until ``remaining`` bytes are done; return what is left."""
+    try:
+        while remaining > 0:
+            copied = copy(remaining)
+            if copied == 0:
+                break
+            remaining -= copied
+    except OSError:
+        # Not supported for these files (e.g. across filesystems)
+        pass
+    return remaining
+
+
+def _fastcopy(src: Path | str, dst: Path | str) -> None:
+    """Copy a file's bytes and metadata, keeping the data in the kernel.
+
+    Uses ``os.copy_file_range`` where available, then ``os.sendfile``, and
+    finally a 1 MiB ``readinto`` loop. Metadata is copied with
+    ``shutil.copystat`` so the result matches ``shutil.copy2``.
+
+    The source is read once and never again by this process, so the kernel
+    is told to read ahead sequentially and, for files of ``_COPY_CHUNK`` or
+    more (the invoice PDFs), to drop the source pages from the page cache
+    afterwards instead of evicting hotter data.
+
+    Args:
+        src: The file to copy.
+        dst: The destination file path (created or truncated).
+    """
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        in_fd, out_fd = fsrc.fileno(), fdst.fileno()
+        size = remaining = os.fstat(in_fd).st_size
+        if _fadvise is not None:
+            _fadvise(in_fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        if hasattr(os, "copy_file_range"):
+            remaining = _kernel_copy(lambda n: os.copy_file_range(in_fd, out_fd, n), remaining)
+        if remaining > 0 and hasattr(os, "sendfile"):
+            remaining = _kernel_copy(lambda n: os.sendfile(out_fd, in_fd, None, n), remaining)
+        if remaining > 0:
+            # Copy whatever the kernel paths did not, from the current offsets
+            buf = bytearray(_COPY_CHUNK)
+            view = memoryview(buf)
+            while n := fsrc.readinto(buf):
+                fdst.write(view[:n])
+        if _fadvise is not None and size >= _COPY_CHUNK:
+            _fadvise(in_fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    shutil.copystat(src, dst)
+
+
+# Shared by every capture, so threads are started once rather than per
+# capture; a capture copies four files
+_COPY_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="repair-copy")
+
+
+def _copy_batch(pairs: list[tuple[Path | str, Path]]) -> None:
+    """Run independent ``_fastcopy`` calls concurrently.
+
+    The copy syscalls release the GIL, so the copies overlap and the batch
+    takes about as long as its largest file rather than the sum of all.
+
+    Args:
+        pairs: ``(source, destination)`` paths to copy.
+
+    Raises:
+        OSError: The first copy error, after every copy has finished.
+    """
+    futures = [_COPY_POOL.submit(_fastcopy, src, dst) for src, dst in pairs]
+    wait(futures)
+    for future in futures:
+        future.result()
+
+
+@functools.lru_cache(maxsize=1)
+def _date_for_minute(minute: int) -> str:
+    return datetime.date.today().isoformat()
+
+
+def _today_iso() -> str:
+    """Today's date as ``YYYY-MM-DD``, recomputed at most once a minute.
+
+    Local midnight always falls on a minute boundary, so keying the cache on
+    the current minute never serves yesterday's date.
+    """
+    return _date_for_minute(int(time.time() // 60))
+
+
+_CASE_INDEX_FILE = ".index.json"
+_CASE_FOLDER_RE = re.compile(r"^(.+_\d{4}-\d{2}-\d{2})_(\d+)$")
+
+
+def _scan_case_indices(base_dir: Path) -> dict[str, int]:
+    """Rebuild the case index from the folders present under ``base_dir``.
+
+    Args:
+        base_dir: The directory containing repair case folders.
+
+    Returns:
+        A mapping of ``f"{slug}_{date_str}"`` to the highest index in use.
+    """
+    indices: dict[str, int] = {}
+    for entry in base_dir.iterdir():
+        if entry.is_dir():
+            m = _CASE_FOLDER_RE.match(entry.name)
+            if m:
+                key, idx = m.group(1), int(m.group(2))
+                if idx > indices.get(key, 0):
+                    indices[key] = idx
+    return indices
+
+
 def _next_case_index(base_dir: Path, slug: str, date_str: str) -> int:
-    """Compute the next available index for a repair case.
+    """Reserve the next available index for a repair case.
 
-    Examines existing folders under ``base_dir`` that start with
-    ``f"{slug}_{date_str}_"`` and returns the next integer index.
-    Indices are padded to three digits when used in folder names.
+    The last index used for each slug and date is kept in
+    ``base_dir/.index.json``, so finding the next one does not require
+    listing every case folder. If that file is missing or unreadable it is
+    rebuilt once from the folders on disk. Indices are padded to three digits
+    when used in folder names.
 
     Args:
         base_dir: The directory containing repair case folders.
@@ -79,19 +211,107 @@ def _next_case_index(base_dir: Path, slug: str, date_str: str) -> int:
     Returns:
         The next integer index (starting at 1).
     """
-    pattern = re.compile(rf"^{re.escape(slug)}_{re.escape(date_str)}_(\d+)$")
-    max_index = 0
-    for entry in base_dir.iterdir():
-        if entry.is_dir():
-            m = pattern.match(entry.name)
-            if m:
-                try:
-                    idx = int(m.group(1))
-                    if idx > max_index:
-                        max_index = idx
-                except ValueError:
-                    continue
-    return max_index + 1
+    index_path = base_dir / _CASE_INDEX_FILE
+    try:
+        with open(index_path, "r", encoding="utf-8") as f:
+            indices = json.load(f)
+        if not isinstance(indices, dict):
+            raise ValueError("case index is not a JSON object")
+    except (OSError, ValueError):
+        indices = _scan_case_indices(base_dir)
+
+    key = f"{slug}_{date_str}"
+    index = int(indices.get(key, 0)) + 1
+    # Never hand out a folder that already exists (e.g. created by hand)
+    while (base_dir / f"{key}_{index:03d}").exists():
+        index += 1
+    indices[key] = index
+
+    # A unique temp file, so concurrent captures never write the same one
+    with tempfile.NamedTemporaryFile(
+        "w", encoding="utf-8", dir=base_dir, prefix=_CASE_INDEX_FILE + ".", suffix=".tmp", delete=False
+    ) as f:
+        json.dump(indices, f)
+    try:
+        os.replace(f.name, index_path)
+    except OSError:
+        os.unlink(f.name)
+        raise
+    return index
+
+
+_LOG_HEADER = [
+    "invoice_number",
+    "vendor_name",
+    "timestamp",
+    "parser_name",
+    "case_folder",
+]
+
+
+class _RepairLogger:
+    """Append-only ``repair_log.csv`` writer kept open across captures.
+
+    One instance per log path, opened lazily with a 1 MiB buffer. Appended
+    rows are held in memory and written with a single ``writerows`` by
+    ``flush()``/``close()``; every open logger is closed at exit.
+    """
+
+    _instances: dict[Path, "_RepairLogger"] = {}
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._file = None
+        self._writer = None
+        self._pending: list[list] = []
+
+    @classmethod
+    def instance(cls, path: Path) -> "_RepairLogger":
+        """Return the shared logger for ``path``, creating it on first use."""
+        path = Path(path).resolve()
+        logger = cls._instances.get(path)
+        if logger is None:
+            logger = cls._instances[path] = cls(path)
+        return logger
+
+    def append(self, row: list) -> None:
+        """Queue one row for the next ``flush()``."""
+        self._pending.append(row)
+
+    def flush(self, durable: bool = False) -> None:
+        """Write queued rows, adding the header first if the log is new.
+
+        Args:
+            durable: Also ``fsync`` the log so the rows survive a crash. One
+                fsync covers every row written since the last flush.
+        """
+        if self._pending:
+            if self._file is None:
+                self._file = open(self.path, "a", newline="", encoding="utf-8", buffering=1 << 20)
+                self._writer = csv.writer(self._file)
+                if os.path.getsize(self.path) == 0:
+                    self._pending.insert(0, _LOG_HEADER)
+            self._writer.writerows(self._pending)
+            self._pending.clear()
+        if self._file is not None:
+            self._file.flush()
+            if durable:
+                os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._writer = None
+
+    @classmethod
+    def close_all(cls) -> None:
+        for logger in cls._instances.values():
+            logger.close()
+
+
+atexit.register(_RepairLogger.close_all)
 
 
 def capture_repair_event(
@@ -103,6 +323,8 @@ def capture_repair_event(
     invoice_pdf_path: str,
     *,
     root_dir: Path | None = None,
+    durable: bool = False,
+    timestamp: str | None = None,
 ) -> Path:
     """Create a new repair case folder and log the event.
 
@@ -115,6 +337,11 @@ def capture_repair_event(
         invoice_pdf_path:     Path to the invoice PDF file.
         root_dir:             Optional override for the root of the repair loop
                               (defaults to the directory containing this script).
+        durable:              Also fsync the repair log before returning. The
+                              row is always flushed to the OS, so it survives
+                              the process dying; fsync covers a power loss.
+        timestamp:            Optional log timestamp, so batch drivers can pass
+                              one value for many captures (defaults to now).
 
     Returns:
         Path to the newly created repair case directory.
@@ -124,8 +351,7 @@ def capture_repair_event(
     """
     # Determine the base directory for repair data
     if root_dir is None:
-        # ``__file__`` points to this script; its parent is ``repair_loop``
-        root_dir = Path(__file__).resolve().parent
+        root_dir = _DEFAULT_ROOT
 
     repair_cases_dir = root_dir / "repair_cases"
     vendor_agents_dir = root_dir.parent / "vendor_agents"
@@ -133,8 +359,10 @@ def capture_repair_event(
 
     # Verify that all provided files exist
     for path in [original_output_path, corrected_output_path, invoice_pdf_path]:
-        if not Path(path).exists():
-            raise FileNotFoundError(f"Input file does not exist: {path}")
+        try:
+            os.stat(path)
+        except (FileNotFoundError, NotADirectoryError):
+            raise FileNotFoundError(f"Input file does not exist: {path}") from None
 
     parser_src = vendor_agents_dir / parser_name
     if not parser_src.exists():
@@ -147,7 +375,7 @@ def capture_repair_event(
 
     # Generate folder name: slugified vendor, date, padded index
     vendor_slug = _slugify(vendor_name)
-    current_date = datetime.date.today().isoformat()  # YYYY‑MM‑DD
+    current_date = _today_iso()  # YYYY‑MM‑DD
     index = _next_case_index(repair_cases_dir, vendor_slug, current_date)
     folder_name = f"{vendor_slug}_{current_date}_{index:03d}"
     case_dir = repair_cases_dir / folder_name
@@ -157,13 +385,16 @@ def capture_repair_event(
 
     # Copy files into the case directory
     # Use descriptive destination names regardless of source filename
-    shutil.copy2(original_output_path, case_dir / "original_output.json")
-    shutil.copy2(corrected_output_path, case_dir / "corrected_output.json")
-    shutil.copy2(invoice_pdf_path, case_dir / "invoice.pdf")
-    shutil.copy2(parser_src, case_dir / parser_src.name)
+    _copy_batch([
+        (original_output_path, case_dir / "original_output.json"),
+        (corrected_output_path, case_dir / "corrected_output.json"),
+        (invoice_pdf_path, case_dir / "invoice.pdf"),
+        (parser_src, case_dir / parser_src.name),
+    ])
 
     # Append to repair log CSV
-    timestamp = datetime.datetime.now().isoformat(timespec="seconds")
+    if timestamp is None:
+        timestamp = datetime.datetime.now().isoformat(timespec="seconds")
     log_fields = [
         invoice_number,
         vendor_name,
@@ -171,19 +402,9 @@ def capture_repair_event(
         parser_name,
         folder_name,
     ]
-    # If the log file does not exist, write a header first
-    write_header = not logs_path.exists()
-    with open(logs_path, "a", newline="", encoding="utf-8") as csvfile:
-        writer = csv.writer(csvfile)
-        if write_header:
-            writer.writerow([
-                "invoice_number",
-                "vendor_name",
-                "timestamp",
-                "parser_name",
-                "case_folder",
-            ])
-        writer.writerow(log_fields)
+    repair_log = _RepairLogger.instance(logs_path)
+    repair_log.append(log_fields)
+    repair_log.flush(durable=durable)
 
     return case_dir
 
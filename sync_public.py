@@ -4,47 +4,204 @@ Sync Public Script
 Automatically copies invoice_queue.json, email_invoices/, output_jsons/, and converts office_info.xls to JSON.
 """
 
+import io
 import os
+import errno
+import hashlib
 import shutil
 import time
-import subprocess
+import threading
+from contextlib import redirect_stdout
 from datetime import datetime
 
+import orjson
+
+import invoice_categorizer
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # Windows: no reflink ioctl
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    # Without watchdog the service falls back to polling mtimes
+    FileSystemEventHandler = object
+    Observer = None
+
+# ioctl request that makes a file share another file's extents (btrfs, XFS, ...)
+FICLONE = 0x40049409
+
+# Quiet period after a change before syncing, so bursts of writes sync once
+SYNC_SETTLE_SECONDS = 0.5
+
+def _clone_or_copy(source, destination):
+    """Give destination the contents of source without copying bytes if possible.
+
+    Tries a copy-on-write reflink first and copies the data when that isn't
+    supported (e.g. across filesystems). Never a hard link: the dev server
+    rewrites public/invoice_queue.json in place, and through a link that
+    would truncate the root queue too. The source mtime is kept either way
+    so _mirror sees the pair as unchanged next time.
+    A missing source raises FileNotFoundError before destination is touched.
+    """
+    with open(source, 'rb') as src:
+        if os.path.lexists(destination):
+            os.remove(destination)
+        
+        if fcntl is not None:
+            try:
+                with open(destination, 'wb') as dst:
+                    fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+                shutil.copystat(source, destination)
+                return
+            except OSError as e:
+                if os.path.exists(destination):
+                    os.remove(destination)
+                if e.errno not in (errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL, errno.EXDEV, errno.ENOSYS):
+                    raise
+    
+    shutil.copy2(source, destination)
+
+def _mirror(source, destination):
+    """Make destination an exact copy of source, copying only what changed.
+
+    Files are compared by size and modification time (_clone_or_copy keeps
+    the source mtime, so an unchanged file matches on the next sync).
+    """
+    with os.scandir(source) as it:
+        src_entries = {e.name: e for e in it}
+    os.makedirs(destination, exist_ok=True)
+    with os.scandir(destination) as it:
+        dst_entries = {e.name: e for e in it}
+    
+    for name, src_entry in src_entries.items():
+        src_path = os.path.join(source, name)
+        dst_path = os.path.join(destination, name)
+        dst_entry = dst_entries.get(name)
+        
+        if src_entry.is_dir():
+            if dst_entry is not None and not dst_entry.is_dir():
+                os.remove(dst_path)
+            _mirror(src_path, dst_path)
+            continue
+        
+        if dst_entry is not None:
+            if dst_entry.is_dir():
+                shutil.rmtree(dst_path)
+            else:
+                src_stat, dst_stat = src_entry.stat(), dst_entry.stat()
+                # A hard link left by an older sync always "matches"; replace it
+                if ((src_stat.st_size, src_stat.st_mtime_ns) == (dst_stat.st_size, dst_stat.st_mtime_ns)
+                        and not os.path.samestat(src_stat, dst_stat)):
+                    continue
+        _clone_or_copy(src_path, dst_path)
+    
+    for name in dst_entries.keys() - src_entries.keys():
+        dst_path = os.path.join(destination, name)
+        if dst_entries[name].is_dir(follow_symlinks=False):
+            shutil.rmtree(dst_path)
+        else:
+            os.remove(dst_path)
+
+def _mtime(path):
+    """Modification time of path, or 0 if it doesn't exist"""
+    try:
+        return os.path.getmtime(path)
+    except FileNotFoundError:
+        return 0
+
+def _file_stamp(path):
+    """(mtime_ns, size) of path, or None if it is missing or can't be stat'ed"""
+    try:
+        st = os.stat(path)
+    except (OSError, TypeError, ValueError):
+        return None
+    return st.st_mtime_ns, st.st_size
+
+def _categorization_key(queue_file="invoice_queue.json"):
+    """Digest of the queue fields the categorizer reads or writes.
+
+    Each invoice JSON's mtime and size are included, so editing a JSON (e.g.
+    correcting its line items) also triggers a re-categorisation. Status
+    updates and other bookkeeping writes leave it unchanged, so the
+    categorizer only runs when an invoice, its JSON or its category changes.
+    Returns None if the queue can't be read.
+    """
+    try:
+        with open(queue_file, 'rb') as f:
+            queue = orjson.loads(f.read())
+    except (OSError, orjson.JSONDecodeError):
+        return None
+    fields = [
+        (inv.get('vendor'), inv.get('json_path'), inv.get('category'),
+         _file_stamp(inv['json_path']) if inv.get('json_path') else None)
+        for inv in queue
+    ]
+    return hashlib.blake2b(orjson.dumps(fields), digest_size=16).digest()
+
 def sync_invoice_queue():
     """Copy invoice_queue.json to public directory"""
     source = "invoice_queue.json"
     destination = "public/invoice_queue.json"
     
-    if not os.path.exists(source):
-        print(f"❌ Source file not found: {source}")
-        return False
-    
     try:
-        shutil.copy2(source, destination)
+        _clone_or_copy(source, destination)
         print(f"✅ Synced {source} to {destination}")
         return True
+    except FileNotFoundError as e:
+        if e.filename == source:
+            print(f"❌ Source file not found: {source}")
+        else:
+            print(f"❌ Error syncing invoice queue: {e}")
+        return False
     except Exception as e:
         print(f"❌ Error syncing invoice queue: {e}")
         return False
 
+def _queue_published():
+    """True if public/invoice_queue.json matches invoice_queue.json (size and mtime)"""
+    try:
+        src, dst = os.stat("invoice_queue.json"), os.stat("public/invoice_queue.json")
+    except FileNotFoundError:
+        return False
+    return (src.st_size, src.st_mtime_ns) == (dst.st_size, dst.st_mtime_ns)
+
+def refresh_invoice_queue(last_categorized_key):
+    """Categorize the queue if its invoices changed, then publish it.
+
+    The categorizer rewrites invoice_queue.json, so the queue is synced after
+    it runs; syncing first would leave the UI without the new categories.
+    Returns the categorization key of the published queue.
+    """
+    key = _categorization_key()
+    if key != last_categorized_key:
+        run_invoice_categorizer()
+        key = _categorization_key()
+    sync_invoice_queue()
+    if not _queue_published():
+        # Rewritten again mid-sync; publish the latest version
+        sync_invoice_queue()
+    return key
+
 def sync_email_invoices():
     """Copy email_invoices directory to public directory"""
     source = "email_invoices"
     destination = "public/email_invoices"
     
-    if not os.path.exists(source):
-        print(f"❌ Source directory not found: {source}")
-        return False
-    
     try:
-        # Remove existing destination directory if it exists
-        if os.path.exists(destination):
-            shutil.rmtree(destination)
-        
-        # Copy the entire directory
-        shutil.copytree(source, destination)
+        # Copy only new or changed files and drop deleted ones
+        _mirror(source, destination)
         print(f"✅ Synced {source}/ to {destination}/")
         return True
+    except FileNotFoundError as e:
+        if e.filename == source:
+            print(f"❌ Source directory not found: {source}")
+        else:
+            print(f"❌ Error syncing email invoices: {e}")
+        return False
     except Exception as e:
         print(f"❌ Error syncing email invoices: {e}")
         return False
@@ -54,19 +211,17 @@ def sync_output_jsons():
     source = "output_jsons"
     destination = "public/output_jsons"
     
-    if not os.path.exists(source):
-        print(f"❌ Source directory not found: {source}")
-        return False
-    
     try:
-        # Remove existing destination directory if it exists
-        if os.path.exists(destination):
-            shutil.rmtree(destination)
-        
-        # Copy the entire directory
-        shutil.copytree(source, destination)
+        # Copy only new or changed files and drop deleted ones
+        _mirror(source, destination)
         print(f"✅ Synced {source}/ to {destination}/")
         return True
+    except FileNotFoundError as e:
+        if e.filename == source:
+            print(f"❌ Source directory not found: {source}")
+        else:
+            print(f"❌ Error syncing output jsons: {e}")
+        return False
     except Exception as e:
         print(f"❌ Error syncing output jsons: {e}")
         return False
@@ -80,15 +235,21 @@ def convert_office_info():
         return False
     
     try:
-        # Run the conversion script
-        result = subprocess.run(['python3', 'convert_office_info.py'], 
-                              capture_output=True, text=True, timeout=30)
+        # Imported here so pandas is only loaded once the office sheet is needed
+        import convert_office_info as office_info_script
+        
+        # Run the conversion in-process; its progress output stays off the console
+        output = io.StringIO()
+        with redirect_stdout(output):
+            converted = office_info_script.convert_office_info()
         
-        if result.returncode == 0:
+        if converted:
             print(f"✅ Converted {xls_file} to office_info.json")
             return True
         else:
-            print(f"❌ Error converting office info: {result.stderr}")
+            # The script reports the failure on its last line
+            lines = output.getvalue().strip().splitlines()
+            print(f"❌ Error converting office info: {lines[-1] if lines else ''}")
             return False
     except Exception as e:
         print(f"❌ Error running office info conversion: {e}")
@@ -97,72 +258,129 @@ def convert_office_info():
 def run_invoice_categorizer():
     """Run the invoice categorizer to update categories"""
     try:
-        # Run the categorizer script
-        result = subprocess.run(['python3', 'invoice_categorizer.py'], 
-                              capture_output=True, text=True, timeout=60)
-        
-        if result.returncode == 0:
-            print(f"✅ Updated invoice categories")
-            return True
-        else:
-            print(f"❌ Error running categorizer: {result.stderr}")
-            return False
+        # Run the categorizer in-process; its per-invoice output stays off the console
+        with redirect_stdout(io.StringIO()):
+            invoice_categorizer.update_invoice_categories()
+        print(f"✅ Updated invoice categories")
+        return True
     except Exception as e:
         print(f"❌ Error running invoice categorizer: {e}")
         return False
 
-def main():
-    """Main function - continuously sync the files"""
-    print("🔄 Starting Invoice Queue Sync Service")
-    print("=" * 50)
+class _ChangeCollector(FileSystemEventHandler):
+    """Record which watched source changed; the main thread does the syncing"""
+
+    def __init__(self):
+        self.pending = set()
+        self.lock = threading.Lock()
+        self.changed = threading.Event()
+
+    def on_any_event(self, event):
+        for path in (event.src_path, getattr(event, "dest_path", "")):
+            target = _sync_target(path)
+            if target:
+                with self.lock:
+                    self.pending.add(target)
+                self.changed.set()
+
+    def take(self):
+        with self.lock:
+            targets, self.pending = self.pending, set()
+        self.changed.clear()
+        return targets
+
+def _sync_target(path):
+    """Map a changed path to the source it belongs to, or None"""
+    if not path:
+        return None
+    parts = os.path.relpath(os.path.abspath(path)).split(os.sep)
+    if parts[0] in ("email_invoices", "output_jsons"):
+        return parts[0]
+    if len(parts) == 1 and parts[0] in ("invoice_queue.json", "smiles_office_info.xls"):
+        return parts[0]
+    return None
+
+def watch_for_changes():
+    """Sync on filesystem notifications (inotify/FSEvents/ReadDirectoryChangesW)"""
+    collector = _ChangeCollector()
+    observer = Observer()
+    observer.schedule(collector, ".", recursive=False)
+    for directory in ("email_invoices", "output_jsons"):
+        os.makedirs(directory, exist_ok=True)
+        observer.schedule(collector, directory, recursive=True)
+    observer.start()
     
-    # Initial sync
-    sync_invoice_queue()
-    sync_email_invoices()
-    sync_output_jsons()
-    convert_office_info()
-    run_invoice_categorizer()
+    # The categorizer rewrites the queue itself; that write is synced along
+    # with the change that triggered it, so ignore events up to the mtime of
+    # the published copy (sync keeps the source mtime)
+    own_queue_mtime = _mtime("public/invoice_queue.json")
+    last_categorized_key = _categorization_key()  # main() just categorized
     
-    # Monitor for changes
+    try:
+        while True:
+            collector.changed.wait()
+            time.sleep(SYNC_SETTLE_SECONDS)
+            targets = collector.take()
+            
+            if "invoice_queue.json" in targets and _mtime("invoice_queue.json") > own_queue_mtime:
+                print(f"📝 Queue file modified at {datetime.now().strftime('%H:%M:%S')}")
+                last_categorized_key = refresh_invoice_queue(last_categorized_key)
+                own_queue_mtime = _mtime("public/invoice_queue.json")
+            
+            if "email_invoices" in targets:
+                print(f"📄 Email invoices modified at {datetime.now().strftime('%H:%M:%S')}")
+                sync_email_invoices()
+            
+            if "output_jsons" in targets:
+                print(f"📋 Output JSONs modified at {datetime.now().strftime('%H:%M:%S')}")
+                sync_output_jsons()
+            
+            if "smiles_office_info.xls" in targets:
+                print(f"🏢 Office info file modified at {datetime.now().strftime('%H:%M:%S')}")
+                convert_office_info()
+    except KeyboardInterrupt:
+        print("\n🛑 Sync service stopped by user")
+    finally:
+        observer.stop()
+        observer.join()
+
+def poll_for_changes():
+    """Sync by checking modification times every 2 seconds"""
     last_queue_modified = 0
     last_invoices_modified = 0
     last_jsons_modified = 0
     last_office_info_modified = 0
+    last_categorized_key = _categorization_key()  # main() just categorized
     
     while True:
         try:
             # Check invoice queue
-            if os.path.exists("invoice_queue.json"):
-                current_modified = os.path.getmtime("invoice_queue.json")
-                if current_modified > last_queue_modified:
-                    print(f"📝 Queue file modified at {datetime.now().strftime('%H:%M:%S')}")
-                    sync_invoice_queue()
-                    run_invoice_categorizer()  # Re-categorize when queue changes
-                    last_queue_modified = current_modified
+            current_modified = _mtime("invoice_queue.json")
+            if current_modified > last_queue_modified:
+                print(f"📝 Queue file modified at {datetime.now().strftime('%H:%M:%S')}")
+                last_categorized_key = refresh_invoice_queue(last_categorized_key)
+                last_queue_modified = _mtime("public/invoice_queue.json")
             
             # Check email_invoices directory
-            if os.path.exists("email_invoices"):
-                current_modified = os.path.getmtime("email_invoices")
-                if current_modified > last_invoices_modified:
-                    print(f"📄 Email invoices modified at {datetime.now().strftime('%H:%M:%S')}")
-                    sync_email_invoices()
-                    last_invoices_modified = current_modified
+            current_modified = _mtime("email_invoices")
+            if current_modified > last_invoices_modified:
+                print(f"📄 Email invoices modified at {datetime.now().strftime('%H:%M:%S')}")
+                sync_email_invoices()
+                last_invoices_modified = current_modified
             
             # Check output_jsons directory
-            if os.path.exists("output_jsons"):
-                current_modified = os.path.getmtime("output_jsons")
-                if current_modified > last_jsons_modified:
-                    print(f"📋 Output JSONs modified at {datetime.now().strftime('%H:%M:%S')}")
-                    sync_output_jsons()
-                    last_jsons_modified = current_modified
+            current_modified = _mtime("output_jsons")
+            if current_modified > last_jsons_modified:
+                print(f"📋 Output JSONs modified at {datetime.now().strftime('%H:%M:%S')}")
+                sync_output_jsons()
+                last_jsons_modified = current_modified
             
             # Check office info file
-            if os.path.exists("smiles_office_info.xls"):
-                current_modified = os.path.getmtime("smiles_office_info.xls")
-                if current_modified > last_office_info_modified:
-                    print(f"🏢 Office info file modified at {datetime.now().strftime('%H:%M:%S')}")
-                    convert_office_info()
-                    last_office_info_modified = current_modified
+            current_modified = _mtime("smiles_office_info.xls")
+            if current_modified > last_office_info_modified:
+                print(f"🏢 Office info file modified at {datetime.now().strftime('%H:%M:%S')}")
+                convert_office_info()
+                last_office_info_modified = current_modified
             
             time.sleep(2)  # Check every 2 seconds
             
@@ -173,5 +391,23 @@ def main():
             print(f"❌ Error in sync loop: {e}")
             time.sleep(5)
 
+def main():
+    """Main function - continuously sync the files"""
+    print("🔄 Starting Invoice Queue Sync Service")
+    print("=" * 50)
+    
+    # Initial sync; the queue is categorized before it is published
+    run_invoice_categorizer()
+    sync_invoice_queue()
+    sync_email_invoices()
+    sync_output_jsons()
+    convert_office_info()
+    
+    # Monitor for changes
+    if Observer is not None:
+        watch_for_changes()
+    else:
+        poll_for_changes()
+
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+Test Email Vendor Detection
+Checks the keyword matching process_all_existing_emails uses to pick a
+vendor from an email's sender, subject and body.
+"""
+
+from email.message import EmailMessage
+
+from process_all_existing_emails import _match_vendor_keyword, detect_vendor_from_email
+
+def _email(sender, subject="Invoice", body=""):
+    msg = EmailMessage()
+    msg["From"] = sender
+    msg["Subject"] = subject
+    msg.set_content(body)
+    return msg
+
+def test_tc_dental_sender_address():
+    """TC Dental's invoices come from info@tcdentallab.com, with no display name"""
+    assert detect_vendor_from_email(_email("info@tcdentallab.com")) == "tc"
+
+def test_tc_not_matched_inside_words():
+    assert _match_vendor_keyword("please match the totals, etc.") is None
+
+def test_tc_spellings():
+    assert _match_vendor_keyword("invoice from tc dental lab") == "tc"
+    assert _match_vendor_keyword("t.c. dental laboratory, inc.") == "tc"
+
+def test_priority_order():
+    assert _match_vendor_keyword("tc dental via patterson") == "patterson"
+
+if __name__ == "__main__":
+    test_tc_dental_sender_address()
+    test_tc_not_matched_inside_words()
+    test_tc_spellings()
+    test_priority_order()
+    print("✅ Email vendor detection tests passed")
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Test Patterson Parser
+Checks line item extraction from Patterson's ``pdftotext -layout`` text.
+"""
+
+from patterson_invoice_parser_FINAL_WITH_JSON_SAFE import _extract_line_items
+
+def test_single_line_row():
+    items = _extract_line_items("12345678 NITRILE GLOVES MED 2.00 BX $12.50 25.00\n")
+    assert items == [{
+        "product_number": "12345678",
+        "product_name": "NITRILE GLOVES MED",
+        "Quantity": "2.00",
+        "unit_price": "12.50",
+        "line_item_total": "25.00",
+    }]
+
+def test_total_wrapped_onto_next_line():
+    """A row whose total overflows onto the next line is still extracted"""
+    items = _extract_line_items("12345678 GLOVES 1.00 EA $12.50\n12.50\n")
+    assert [(i["product_number"], i["product_name"], i["unit_price"], i["line_item_total"]) for i in items] == [
+        ("12345678", "GLOVES", "12.50", "12.50"),
+    ]
+
+def test_description_does_not_span_lines():
+    """The product number and description must share a line"""
+    assert _extract_line_items("12345678\nGLOVES 1.00 EA $12.50 12.50\n") == []
+
+def test_rows_without_price_are_skipped():
+    text = "12345678 BACKORDERED ITEM\n87654321 BIBS 3.00 CS $1,050.00 3,150.00\n"
+    items = _extract_line_items(text)
+    assert [(i["product_number"], i["line_item_total"]) for i in items] == [("87654321", "3150.00")]
+
+if __name__ == "__main__":
+    test_single_line_row()
+    test_total_wrapped_onto_next_line()
+    test_description_does_not_span_lines()
+    test_rows_without_price_are_skipped()
+    print("✅ Patterson parser tests passed")
@@ -4,10 +4,15 @@ UI Upload Service - Monitors invoice queue and uploads to PCS AI UI
 """
 
 import os
-import json
+import sys
+import logging
+import logging.handlers
+import orjson
 import time
 from datetime import datetime
 
+from invoice_queue_writer import locked_queue, write_queue_file
+
 # Configuration
 INVOICE_QUEUE_PATH = os.path.join(os.path.dirname(__file__), "invoice_queue.json")
 OUTPUT_JSONS_PATH = os.path.join(os.path.dirname(__file__), "output_jsons")
@@ -18,44 +23,72 @@ LOG_PATH = os.path.join(os.path.dirname(__file__), "ui_upload.log")
 UI_BASE_URL = "http://localhost:5173"  # Vite dev server
 API_ENDPOINT = "/api/invoices"
 
-def log(msg):
-    """Log messages with timestamp"""
-    timestamp = datetime.now().isoformat()
-    with open(LOG_PATH, "a") as f:
-        f.write(f"[{timestamp}] {msg}\n")
-    print(f"[{timestamp}] {msg}")
+# The log file stays open between records instead of being reopened per line
+logger = logging.getLogger("ui_upload_service")
+logger.setLevel(logging.INFO)
+logger.propagate = False
+if not logger.handlers:
+    _formatter = logging.Formatter("[%(asctime)s] %(message)s", datefmt="%Y-%m-%dT%H:%M:%S")
+    for _handler in (
+        logging.handlers.RotatingFileHandler(LOG_PATH, maxBytes=10 << 20, backupCount=3, encoding="utf-8"),
+        logging.StreamHandler(sys.stdout),
+    ):
+        _handler.setFormatter(_formatter)
+        logger.addHandler(_handler)
+
+log = logger.info
 
 def load_invoice_queue():
     """Load invoice queue from file"""
-    if os.path.exists(INVOICE_QUEUE_PATH):
-        with open(INVOICE_QUEUE_PATH, 'r') as f:
-            return json.load(f)
-    return []
+    try:
+        with open(INVOICE_QUEUE_PATH, 'rb') as f:
+            return orjson.loads(f.read())
+    except FileNotFoundError:
+        return []
 
-def mark_invoice_uploaded(invoice_number):
-    """Mark invoice as uploaded in queue"""
-    queue = load_invoice_queue()
-    for invoice in queue:
-        if invoice.get('invoice_number') == invoice_number:
-            invoice['status'] = 'uploaded'
-            invoice['uploaded_at'] = datetime.now().isoformat()
-            break
-    
-    with open(INVOICE_QUEUE_PATH, 'w') as f:
-        json.dump(queue, f, indent=2)
+def mark_invoice_uploaded(*invoice_numbers):
+    """Mark invoices as uploaded in queue
 
-def upload_invoice_to_ui(invoice_data):
-    """Upload invoice data to PCS AI UI"""
+    The queue is read, updated and atomically replaced under locked_queue,
+    the lock every queue writer takes.
+    """
+    with locked_queue(INVOICE_QUEUE_PATH):
+        try:
+            with open(INVOICE_QUEUE_PATH, 'rb') as f:
+                queue = orjson.loads(f.read())
+        except FileNotFoundError:
+            return
+        
+        # Index by invoice number; the first entry wins, as the old scan did
+        by_number = {}
+        for invoice in queue:
+            by_number.setdefault(invoice.get('invoice_number'), invoice)
+        
+        uploaded_at = datetime.now().isoformat()
+        for invoice_number in invoice_numbers:
+            invoice = by_number.get(invoice_number)
+            if invoice is not None:
+                invoice['status'] = 'uploaded'
+                invoice['uploaded_at'] = uploaded_at
+        
+        write_queue_file(INVOICE_QUEUE_PATH, queue)
+
+def upload_invoice_to_ui(invoice_data, uploaded=None):
+    """Upload invoice data to PCS AI UI
+
+    When ``uploaded`` is a list the invoice number is appended to it and the
+    caller marks the whole batch at once; otherwise the queue is updated now.
+    """
     try:
         # Load parsed JSON data
         json_file_path = invoice_data['json_path']
-        if not os.path.exists(json_file_path):
+        try:
+            with open(json_file_path, 'rb') as f:
+                parsed_data = orjson.loads(f.read())
+        except FileNotFoundError:
             log(f"❌ JSON file not found: {json_file_path}")
             return False
         
-        with open(json_file_path, 'r') as f:
-            parsed_data = json.load(f)
-        
         # Load PDF file
         pdf_file_path = invoice_data['pdf_path']
         if not os.path.exists(pdf_file_path):
@@ -87,7 +120,10 @@ def upload_invoice_to_ui(invoice_data):
         log(f"🏥 Clinic: {invoice_data['clinic_id']}")
         
         # Mark as uploaded
-        mark_invoice_uploaded(invoice_data['invoice_number'])
+        if uploaded is None:
+            mark_invoice_uploaded(invoice_data['invoice_number'])
+        else:
+            uploaded.append(invoice_data['invoice_number'])
         log(f"✅ Invoice {invoice_data['invoice_number']} uploaded successfully")
         
         return True
@@ -106,15 +142,17 @@ def process_new_invoices():
     
     log(f"📋 Found {len(new_invoices)} new invoices to upload")
     
+    uploaded = []
     for invoice in new_invoices:
-        success = upload_invoice_to_ui(invoice)
+        success = upload_invoice_to_ui(invoice, uploaded)
         if success:
             log(f"✅ Successfully uploaded invoice {invoice['invoice_number']}")
         else:
             log(f"❌ Failed to upload invoice {invoice['invoice_number']}")
-        
-        # Small delay between uploads
-        time.sleep(1)
+    
+    # Write the queue once for the whole batch
+    if uploaded:
+        mark_invoice_uploaded(*uploaded)
 
 def main():
     """Main function"""
@@ -129,12 +167,14 @@ def main():
     while True:
         try:
             # Check if queue file has been modified
-            if os.path.exists(INVOICE_QUEUE_PATH):
+            try:
                 current_modified = os.path.getmtime(INVOICE_QUEUE_PATH)
-                if current_modified > last_modified:
-                    log("📋 Queue file modified, processing new invoices")
-                    process_new_invoices()
-                    last_modified = current_modified
+            except FileNotFoundError:
+                current_modified = 0
+            if current_modified > last_modified:
+                log("📋 Queue file modified, processing new invoices")
+                process_new_invoices()
+                last_modified = current_modified
             
             # Wait before checking again
             time.sleep(5)
@@ -4,85 +4,459 @@ Vendor Router - Routes PDF invoices to appropriate vendor parsers
 """
 
 import os
+import io
 import sys
-import subprocess
 import json
+import re
+import importlib
+import logging
+import queue
+import multiprocessing
+import signal
+import time
+from contextlib import contextmanager, redirect_stdout
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from itertools import islice
 from datetime import datetime
 
+import fitz
+
+from invoice_parse_cache import bytes_digest, cached_vendor, remember_vendor
+
+# Without Pillow and an OCR engine, scanned pages go straight to the parser
+# fallback
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+@contextmanager
+def _single_threaded_ocr():
+    """Keep tesseract single-threaded for the duration of the block.
+
+    Vendor detection OCRs OCR_WORKERS pages at once, so each tesseract gets
+    one thread to avoid oversubscribing cores. OMP_THREAD_LIMIT is only set
+    inside the block, so the parsers' own full-page OCR keeps all its
+    threads. A limit already set in the environment is left alone.
+    """
+    if "OMP_THREAD_LIMIT" in os.environ:
+        yield
+        return
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+    try:
+        yield
+    finally:
+        os.environ.pop("OMP_THREAD_LIMIT", None)
+
+# tesserocr runs Tesseract in-process; pytesseract starts the CLI per page.
+# OpenMP reads OMP_THREAD_LIMIT when the library loads, so the in-process
+# engine (used only for detection) is limited at import; each pytesseract
+# child reads it at launch, inside detect_vendor_in_pdf's OCR block.
+with _single_threaded_ocr():
+    try:
+        import tesserocr
+    except ImportError:
+        tesserocr = None
+
+try:
+    import pytesseract
+except ImportError:
+    pytesseract = None
+
+OCR_AVAILABLE = Image is not None and (tesserocr is not None or pytesseract is not None)
+
 PARSER_FOLDER = os.path.dirname(__file__)
 OUTPUT_FOLDER = os.path.join(PARSER_FOLDER, "output_jsons/")
 QUEUE_WRITER = os.path.join(PARSER_FOLDER, "invoice_queue_writer.py")
 
-# Vendor parser mappings
-VENDOR_PARSERS = {
-    'epic': 'epic_parser.py',
-    'patterson': 'patterson_invoice_parser_FINAL_WITH_JSON_SAFE.py',
-    'henry': 'henry_parser.py',
-    'exodus': 'exodus_parser.py',
-    'artisan': 'parse_artisan_dental_exporting_fixed.py',
-    'tc': 'parse_tc_dental_invoice.py'
+# Module and entrypoint of each vendor parser
+PARSER_ENTRYPOINTS = {
+    'epic': ('epic_parser', 'extract_invoice_data'),
+    'patterson': ('patterson_invoice_parser_FINAL_WITH_JSON_SAFE', 'parse_patterson_invoice'),
+    'henry': ('henry_parser', 'parse'),
+    'exodus': ('exodus_parser', 'parse_exodus_invoice'),
+    'artisan': ('parse_artisan_dental_exporting_fixed', 'parse_invoice'),
+    'tc': ('parse_tc_dental_invoice', 'parse_tc_dental_invoice')
 }
 
-def detect_vendor_from_pdf(filepath):
-    """Detect vendor by running all parsers and seeing which one succeeds"""
-    for vendor, parser in VENDOR_PARSERS.items():
-        parser_path = os.path.join(PARSER_FOLDER, parser)
-        if not os.path.exists(parser_path):
-            continue
-            
+# Phrases in a PDF's text layer that identify each vendor (matched lowercase,
+# on word boundaries). Artisan's invoices never print the lab's name, only
+# its street address. Scanned PDFs have no text and fall back to the parsers.
+VENDOR_KEYWORDS = {
+    'epic': ['epic dental'],
+    'patterson': ['patterson dental', 'patterson'],
+    'henry': ['henry schein'],
+    'exodus': ['exodus dental', 'exodus'],
+    'artisan': ['artisan dental', '2532 se hawthorne'],
+    'tc': ['tc dental', 't.c. dental'],
+}
+
+# A page with no more text than this is treated as scanned (image only)
+MIN_PAGE_TEXT_CHARS = 20
+
+# Resolution for OCR'ing a scanned page during vendor detection; vendor
+# names are large print, so this is enough to read them
+OCR_DPI = 120
+
+# Scanned pages OCR'd at once; each runs its own tesseract process
+OCR_WORKERS = 4
+
+# Vendor detection only needs a few words anywhere on the page: LSTM engine
+# only, sparse-text layout, and no second pass over an inverted image
+TESSERACT_CONFIG = "--oem 1 --psm 11 -c tessedit_do_invert=0"
+
+# One alternation for all vendors; the named group of the match is the vendor
+_VENDOR_KEYWORD_RE = re.compile('|'.join(
+    f"(?P<{vendor}>" + '|'.join(rf"\b{re.escape(k)}\b" for k in keywords) + ")"
+    for vendor, keywords in VENDOR_KEYWORDS.items()
+))
+
+# henry_parser writes output_jsons/<stem>.json itself
+SELF_SAVING_VENDORS = {'henry'}
+
+# Seconds a parser may run before it is abandoned (the email scripts gave
+# their parser subprocess 120 s)
+PARSER_TIMEOUT = 120
+
+logger = logging.getLogger(__name__)
+
+_parser_callables = {}
+
+# Persistent worker processes the parsers run in, enough for every parser
+# at once; created on first use and replaced when a parser hangs or dies
+PARSER_WORKERS = len(PARSER_ENTRYPOINTS)
+_parser_pool = None
+
+# Vendor keyword found in each PDF this process has scanned, by content digest
+# (None when the scan found nothing). Oldest entries are dropped past the limit.
+_pdf_vendors = {}
+PDF_VENDOR_MEMO_SIZE = 128
+
+def get_parser_callable(vendor):
+    """Import the vendor's parser module once and return its entrypoint, or None"""
+    if vendor in _parser_callables:
+        return _parser_callables[vendor]
+    entry = PARSER_ENTRYPOINTS.get(vendor)
+    if not entry:
+        return None
+    module_name, func_name = entry
+    if PARSER_FOLDER not in sys.path:
+        sys.path.insert(0, PARSER_FOLDER)
+    # Imported lazily: henry_parser loads the office spreadsheet at import time
+    func = getattr(importlib.import_module(module_name), func_name)
+    _parser_callables[vendor] = func
+    return func
+
+def _call_parser(filepath, vendor, quiet=False):
+    """Run the vendor's parser in this process; returns its result, or None if there is no parser"""
+    parse = get_parser_callable(vendor)
+    if parse is None:
+        return None
+    if quiet:
+        with redirect_stdout(io.StringIO()):
+            return parse(filepath)
+    return parse(filepath)
+
+def _save_output(filepath, result, vendor):
+    """Write a parsed invoice to OUTPUT_FOLDER/<stem>.json, unless its parser saves it itself"""
+    if vendor in SELF_SAVING_VENDORS:
+        return
+    os.makedirs(OUTPUT_FOLDER, exist_ok=True)
+    outpath = os.path.join(OUTPUT_FOLDER, Path(filepath).stem + ".json")
+    with open(outpath, "w") as f:
+        json.dump(result, f, indent=2)
+
+def parse_in_process(filepath, vendor, quiet=False, report_errors=None):
+    """Run the vendor's parser in this process and save its JSON output.
+
+    Returns the parsed invoice dict, or None when the parser rejects the file.
+    With ``quiet`` the parser's own console output is swallowed, so detection
+    attempts against the wrong vendor's parser stay off the console.
+    A parser that raises is logged with its traceback when ``report_errors``
+    is true (default: not ``quiet``); otherwise only at debug level, since
+    trying the wrong vendor's parser is expected to fail.
+    """
+    if report_errors is None:
+        report_errors = not quiet
+    try:
+        result = _call_parser(filepath, vendor, quiet)
+    except Exception:
+        log_error = logger.exception if report_errors else logger.debug
+        log_error("%s parser failed on %s", vendor, filepath, exc_info=True)
+        return None
+    if not isinstance(result, dict):
+        return None
+    _save_output(filepath, result, vendor)
+    return result
+
+class ParserTimeout(BaseException):
+    """A parser ran past PARSER_TIMEOUT.
+
+    Derived from BaseException so the parsers' own ``except Exception``
+    blocks can't swallow it.
+    """
+
+@contextmanager
+def _time_limit(seconds):
+    """Raise ParserTimeout in the main thread if the block runs past ``seconds``"""
+    def expire(signum, frame):
+        raise ParserTimeout()
+    previous = signal.signal(signal.SIGALRM, expire)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+def _get_parser_pool():
+    """Return the parser worker pool, starting it if needed"""
+    global _parser_pool
+    if _parser_pool is None:
+        # Forkserver workers start from a clean process, never a fork of a
+        # caller that still has OCR threads running
+        _parser_pool = ProcessPoolExecutor(max_workers=PARSER_WORKERS, mp_context=multiprocessing.get_context("forkserver"))
+    return _parser_pool
+
+def _reset_parser_pool():
+    """Kill the parser workers (one is stuck or died); the next parse starts new ones"""
+    global _parser_pool
+    pool, _parser_pool = _parser_pool, None
+    if pool is None:
+        return
+    # A worker stuck in a parser never takes another job, so it is killed
+    for process in list((pool._processes or {}).values()):
+        process.kill()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def parse_first(filepath, vendors, report_errors=True):
+    """Run the vendors' parsers at once in worker processes and save the winner's JSON output.
+
+    Returns (vendor, parsed dict) for the first vendor, in the order given,
+    whose parser accepts the PDF, or (None, None). Results are checked in
+    that order, so a lower-priority parser that finishes first doesn't win.
+    The workers are persistent, so the parsers are imported once. All the
+    parsers share one PARSER_TIMEOUT deadline; workers still running one
+    once the winner is known, or that die, are killed and replaced on the
+    next parse. Inside a pool worker of its own (route_batch, the email
+    scripts), which can't start processes, the parsers run in-process one
+    after another under the same deadline.
+    Failures are logged as in parse_in_process; timeouts and dead workers
+    always are.
+    """
+    filepath = os.path.abspath(filepath)
+    if multiprocessing.current_process().daemon:
+        vendor = None
         try:
-            result = subprocess.run(
-                ["python3", parser_path, filepath],
-                capture_output=True,
-                text=True,
-                timeout=30
-            )
-            
-            # Check for successful parsing based on vendor-specific indicators
-            if result.returncode == 0:
-                if vendor == 'epic' and "Extracted" in result.stdout:
-                    return vendor
-                elif vendor == 'henry' and ("Henry schein" in result.stdout or "Henry Schein" in result.stdout):
-                    return vendor
-                elif vendor == 'patterson' and ("Patterson" in result.stdout):
-                    return vendor
-                elif vendor == 'exodus' and ("Exodus" in result.stdout):
-                    return vendor
-                elif vendor == 'artisan' and ("Artisan" in result.stdout):
-                    return vendor
-                elif vendor == 'tc' and ("TC" in result.stdout or "T.C." in result.stdout):
-                    return vendor
-                # For other vendors, check if they output valid JSON
-                elif "vendor" in result.stdout and "invoice_number" in result.stdout:
-                    return vendor
-                    
-        except subprocess.TimeoutExpired:
+            with _time_limit(PARSER_TIMEOUT):
+                for vendor in vendors:
+                    result = parse_in_process(filepath, vendor, quiet=True, report_errors=report_errors)
+                    if result is not None:
+                        return vendor, result
+        except ParserTimeout:
+            logger.error("%s parser timed out after %d s on %s", vendor, PARSER_TIMEOUT, filepath)
+        return None, None
+
+    pool = _get_parser_pool()
+    futures = {vendor: pool.submit(_call_parser, filepath, vendor, True) for vendor in vendors}
+    deadline = time.monotonic() + PARSER_TIMEOUT
+    winner, result, broken = None, None, False
+    failures = []
+    for vendor, future in futures.items():
+        try:
+            parsed = future.result(timeout=max(0, deadline - time.monotonic()))
+        except TimeoutError:
+            logger.error("%s parser timed out after %d s on %s", vendor, PARSER_TIMEOUT, filepath)
+            failures.append(f"{vendor}: timed out")
             continue
-        except Exception:
+        except BrokenProcessPool:
+            logger.error("%s parser's worker died on %s", vendor, filepath)
+            failures.append(f"{vendor}: worker died")
+            broken = True
             continue
+        except Exception as e:
+            log_error = logger.exception if report_errors else logger.debug
+            log_error("%s parser failed on %s", vendor, filepath, exc_info=True)
+            failures.append(f"{vendor}: {e!r}")
+            continue
+        if isinstance(parsed, dict):
+            winner, result = vendor, parsed
+            break
+        failures.append(f"{vendor}: rejected")
+
+    # Parsers not started yet are dropped; a worker still running one
+    # (stuck, or behind the winner) would stay busy, so it is killed
+    running = [future for future in futures.values() if not future.cancel() and not future.done()]
+    if broken or running:
+        _reset_parser_pool()
+    if winner is None:
+        if failures:
+            logger.warning("No parser accepted %s (%s)", filepath, "; ".join(failures))
+        return None, None
+    _save_output(filepath, result, winner)
+    return winner, result
+
+def parse_isolated(filepath, vendor, report_errors=True):
+    """Run one vendor's parser through parse_first; returns the parsed dict or None"""
+    return parse_first(filepath, [vendor], report_errors)[1]
+
+# Idle tesserocr engines. An engine isn't thread-safe, so each OCR worker
+# borrows one; they stay initialized (language data loaded) between calls.
+_tess_apis = queue.SimpleQueue()
+
+def render_page(page):
+    """Rasterize a PyMuPDF page at OCR_DPI into a greyscale PIL image"""
+    pix = page.get_pixmap(dpi=OCR_DPI, colorspace=fitz.csGRAY)
+    return Image.frombytes("L", (pix.width, pix.height), pix.samples)
+
+def ocr_image(image):
+    """OCR a page image and return its text in lowercase"""
+    if tesserocr is None:
+        return pytesseract.image_to_string(image, config=TESSERACT_CONFIG).lower()
     
-    return None
+    try:
+        api = _tess_apis.get_nowait()
+    except queue.Empty:
+        api = tesserocr.PyTessBaseAPI(psm=tesserocr.PSM.SPARSE_TEXT, oem=tesserocr.OEM.LSTM_ONLY)
+        api.SetVariable("tessedit_do_invert", "0")
+    try:
+        api.SetImage(image)
+        return api.GetUTF8Text().lower()
+    finally:
+        _tess_apis.put(api)
 
-def run_parser(filepath, vendor):
-    """Run the appropriate vendor parser"""
-    parser = VENDOR_PARSERS.get(vendor)
-    if not parser:
-        return False
-        
-    parser_path = os.path.join(PARSER_FOLDER, parser)
-    if not os.path.exists(parser_path):
-        return False
-        
+def detect_vendor(text):
+    """Return the vendor whose keyword appears first in text, or None"""
+    match = _VENDOR_KEYWORD_RE.search(text)
+    return match.lastgroup if match else None
+
+def detect_vendor_in_pdf(filepath, pdf_bytes=None):
+    """Find a vendor keyword in the PDF, stopping at the first page that has one.
+
+    Pages are read from the text layer one at a time. Pages without usable
+    text (scanned pages, including a scanned cover in front of a text body)
+    are then OCR'd, OCR_WORKERS at a time, stopping as soon as any page turns
+    up a keyword. Pages that have text are never OCR'd.
+    ``pdf_bytes``, when given, is the file already read into memory and is
+    opened in place of ``filepath``.
+    Returns the vendor, or None if no keyword was found or the PDF can't be read.
+    """
     try:
-        result = subprocess.run(
-            ["python3", parser_path, filepath],
-            capture_output=True,
-            text=True,
-            timeout=30
-        )
-        return result.returncode == 0
+        if pdf_bytes is not None:
+            doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+        else:
+            doc = fitz.open(filepath)
+        with doc:
+            blank_pages = []
+            for page in doc:
+                text = page.get_text().lower()
+                vendor = detect_vendor(text)
+                if vendor:
+                    return vendor
+                if len(text.strip()) <= MIN_PAGE_TEXT_CHARS:
+                    blank_pages.append(page)
+            
+            if not OCR_AVAILABLE or not blank_pages:
+                return None
+            # PyMuPDF isn't thread-safe, so pages are rendered here and only
+            # the OCR runs on the pool. A page is rendered when a worker frees
+            # up, so nothing past the first hit is rendered.
+            remaining = iter(blank_pages)
+            pool = ThreadPoolExecutor(max_workers=OCR_WORKERS)
+            try:
+                with _single_threaded_ocr():
+                    pending = {pool.submit(ocr_image, render_page(page)) for page in islice(remaining, OCR_WORKERS)}
+                    while pending:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            vendor = detect_vendor(future.result())
+                            if vendor:
+                                return vendor
+                        pending |= {pool.submit(ocr_image, render_page(page)) for page in islice(remaining, len(done))}
+            finally:
+                # Don't hold the caller up for pages still being OCR'd
+                pool.shutdown(wait=False, cancel_futures=True)
     except Exception:
-        return False
+        pass
+    return None
+
+def detect_and_parse(filepath, detected_vendor=None, digest=None):
+    """Find the PDF's vendor and parse it in a worker process; returns (vendor, parsed dict) or (None, None).
+
+    ``digest``, when the caller has already hashed the PDF (pdf_digest), saves
+    hashing it again.
+    """
+    # Read the PDF once for both the content hash and the keyword scan
+    try:
+        with open(filepath, "rb") as f:
+            pdf_bytes = f.read()
+    except OSError:
+        pdf_bytes = None
+    if digest is None and pdf_bytes is not None:
+        digest = bytes_digest(pdf_bytes)
+
+    # A PDF seen before goes straight to the parser that handled it
+    known_vendor = cached_vendor(digest)
+    if known_vendor in PARSER_ENTRYPOINTS:
+        # This parser handled these exact bytes before, so a failure is news
+        result = parse_isolated(filepath, known_vendor)
+        if result is not None:
+            return known_vendor, result
+
+    if digest is not None and digest in _pdf_vendors:
+        pdf_vendor = _pdf_vendors[digest]
+    else:
+        pdf_vendor = detect_vendor_in_pdf(filepath, pdf_bytes)
+        if digest is not None:
+            if len(_pdf_vendors) >= PDF_VENDOR_MEMO_SIZE:
+                del _pdf_vendors[next(iter(_pdf_vendors))]
+            _pdf_vendors[digest] = pdf_vendor
+
+    tried = {known_vendor}
+    if pdf_vendor in PARSER_ENTRYPOINTS and pdf_vendor not in tried:
+        # The PDF names its vendor: that parser goes first, on its own, and a
+        # crash in it is reported
+        result = parse_isolated(filepath, pdf_vendor)
+        if result is not None:
+            remember_vendor(digest, pdf_vendor)
+            return pdf_vendor, result
+        tried.add(pdf_vendor)
+
+    # No keyword (e.g. a scanned PDF without OCR), or a broad keyword such as
+    # "patterson" that named the wrong vendor: the vendor detected from the
+    # email first, then every other parser. They run concurrently, the first
+    # in order that succeeds winning; most are expected to fail, so their
+    # crashes are only logged at debug level.
+    candidates = [vendor for vendor in PARSER_ENTRYPOINTS if vendor not in tried]
+    if detected_vendor in candidates:
+        candidates.remove(detected_vendor)
+        candidates.insert(0, detected_vendor)
+    vendor, result = parse_first(filepath, candidates, report_errors=False)
+    if vendor is not None:
+        remember_vendor(digest, vendor)
+    return vendor, result
+
+def run_parser(filepath, vendor):
+    """Run the appropriate vendor parser in a worker process; True if it parsed the PDF"""
+    return parse_isolated(filepath, vendor) is not None
+
+def route_pdf(filepath, detected_vendor=None):
+    """Parse one PDF with the right vendor parser and return the vendor, or None"""
+    vendor, _ = detect_and_parse(filepath, detected_vendor)
+    return vendor
+
+def route_batch(filepaths, max_workers=None):
+    """Route many PDFs concurrently; returns {filepath: vendor or None}.
+
+    PyMuPDF isn't thread-safe, so the PDFs are spread over worker processes,
+    each importing the parsers once and running them in-process under
+    PARSER_TIMEOUT.
+    """
+    filepaths = list(filepaths)
+    with multiprocessing.Pool(max_workers or os.cpu_count()) as pool:
+        return dict(zip(filepaths, pool.map(route_pdf, filepaths)))
 
 def main():
     if len(sys.argv) < 2:
@@ -96,14 +470,7 @@ def main():
         print(f"File not found: {filepath}")
         sys.exit(1)
     
-    # If vendor was detected from email, try that first
-    if detected_vendor and detected_vendor in VENDOR_PARSERS:
-        if run_parser(filepath, detected_vendor):
-            print(detected_vendor)
-            sys.exit(0)
-    
-    # Otherwise, try to detect vendor from PDF content
-    vendor = detect_vendor_from_pdf(filepath)
+    vendor = route_pdf(filepath, detected_vendor)
     if vendor:
         print(vendor)
         sys.exit(0)